@@ -3,9 +3,12 @@ from tensorflow import keras
 import numpy as np
 
 class ProbSparseAttention(keras.layers.Layer):
-    def __init__(self, factor=5):
+    # serving / keep_heads as in the root layers.py, so export.py and pruning.py work on these checkpoints
+    def __init__(self, factor=5, serving=False, keep_heads=None):
         super(ProbSparseAttention, self).__init__()
         self.factor = factor
+        self.serving = serving
+        self.keep_heads = None if keep_heads is None else np.asarray(keep_heads, dtype=np.int32)
 
     def _prob_QK(self, Q, K, sample_k, n_top):
         # Q [B, H, L, D]
@@ -23,7 +26,7 @@ class ProbSparseAttention(keras.layers.Layer):
         K_sample = tf.gather(K_sample, indx_q_seq, axis=2) # [B, H, L~, L, D]
         K_sample = tf.gather(K_sample, indx_k_seq, axis=3) # [B, H, L~, sample_k, D]
 
-        Q_K_sample = tf.squeeze(tf.matmul(tf.expand_dims(Q, -2), tf.einsum("...ij->...ji", K_sample))) # [B, H, L~, D]
+        Q_K_sample = tf.squeeze(tf.matmul(tf.expand_dims(Q, -2), tf.einsum("...ij->...ji", K_sample)), -2) # [B, H, L~, D]
         # find the Top_k query with sparisty measurement
         M = tf.math.reduce_max(Q_K_sample, axis=-1) - tf.raw_ops.Div(x=tf.reduce_sum(Q_K_sample, axis=-1), y=L)
         M_top = tf.math.top_k(M, n_top, sorted=False)[1]
@@ -39,16 +42,36 @@ class ProbSparseAttention(keras.layers.Layer):
 
         return Q_K, idx
 
+    def _serve(self, Q, K, V, n_top):
+        L = Q.shape[2]
+        Q_K = tf.matmul(Q, K, transpose_b=True) # [B, H, L, L]
+        M = tf.math.reduce_max(Q_K, axis=-1) - tf.reduce_sum(Q_K, axis=-1) / L
+        select = tf.one_hot(tf.math.top_k(M, n_top, sorted=False)[1], L) # [B, H, n_top, L]
+        attn = tf.keras.activations.softmax(tf.matmul(select, Q_K), axis=-1) # [B, H, n_top, L]
+        mask = tf.expand_dims(tf.reduce_sum(select, -2), -1) # [B, H, L, 1], 1 for the top queries
+        context = tf.expand_dims(tf.reduce_sum(V, -2), -2) * (1 - mask)
+        return context + tf.matmul(select, tf.matmul(attn, V), transpose_a=True) # [B, H, L, D]
+
     def call(self, x):
         Q, K, V = x
         B, L, H, D = Q.shape
         Q = tf.reshape(Q, (B, H, L, -1))
         K = tf.reshape(K, (B, H, L, -1))
         V = tf.reshape(V, (B, H, L, -1))
+        if self.keep_heads is None:
+            return self._attend(Q, K, V)
+
+        Q, K, V = [tf.gather(t, self.keep_heads, axis=1) for t in (Q, K, V)]
+        context = self._attend(Q, K, V) # [B, kept heads, L, D]
+        return tf.einsum("bkld,kh->bhld", context, np.eye(H, dtype=np.float32)[self.keep_heads])
 
+    def _attend(self, Q, K, V):
+        B, H, L, _ = Q.shape
         U = self.factor * np.ceil(np.log(L)).astype('int').item()
         u = self.factor * np.ceil(np.log(L)).astype('int').item()
         # u = L  # Didn't work!! (testing)accuracy/f1 didn't improve. training converge as normal. sampling acts as the dropouts in canonical transformer.
+        if self.serving:
+            return self._serve(Q, K, V, U)
 
         scores_top, idx = self._prob_QK(Q, K, u, U)
         V_sum = tf.reduce_sum(V, -2)
@@ -62,9 +85,9 @@ class ProbSparseAttention(keras.layers.Layer):
 
 
 class MultiHeadSelfAttention(keras.layers.Layer):
-    def __init__(self, d_model, num_heads):
+    def __init__(self, d_model, num_heads, serving=False, keep_heads=None):
         super(MultiHeadSelfAttention, self).__init__()
-        self.attention = ProbSparseAttention()
+        self.attention = ProbSparseAttention(serving=serving, keep_heads=keep_heads)
         self.d_model = d_model
         self.num_heads = num_heads
 
@@ -23,7 +23,7 @@ class ProbSparseAttention(keras.layers.Layer):
         K_sample = tf.gather(K_sample, indx_q_seq, axis=2) # [B, H, L~, L, D]
         K_sample = tf.gather(K_sample, indx_k_seq, axis=3) # [B, H, L~, sample_k, D]
 
-        Q_K_sample = tf.squeeze(tf.matmul(tf.expand_dims(Q, -2), tf.einsum("...ij->...ji", K_sample))) # [B, H, L~, D]
+        Q_K_sample = tf.squeeze(tf.matmul(tf.expand_dims(Q, -2), tf.einsum("...ij->...ji", K_sample)), -2) # [B, H, L~, D]
         # find the Top_k query with sparisty measurement
         M = tf.math.reduce_max(Q_K_sample, axis=-1) - tf.raw_ops.Div(x=tf.reduce_sum(Q_K_sample, axis=-1), y=L)
         M_top = tf.math.top_k(M, n_top, sorted=False)[1]
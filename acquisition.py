@@ -0,0 +1,139 @@
+import time
+import numpy as np
+import tensorflow as tf
+from gaussian_process import GaussianProcess, RBF, Matern52
+
+# Multi-start EI maximisation for a fitted gaussian_process.GaussianProcess. All starts are ascended
+# together inside one tf.function: EI and its gradient for every start come from the same batched
+# kernel matrix and triangular solve against the GP's cached Cholesky factor.
+
+def tf_kernel(kind, x1, x2, scale, sigma):
+    # kind: RBF or Matern52; scale [D] (RBF l / Matern theta), sigma [] as tensors, so they are not baked into a trace
+    x1, x2 = x1 / scale, x2 / scale
+    d = tf.reduce_sum(x1**2, -1)[:, tf.newaxis] + tf.reduce_sum(x2**2, -1)[tf.newaxis, :] - 2 * tf.matmul(x1, x2, transpose_b=True)
+    d = tf.maximum(d, 0.)
+    if kind is RBF:
+        return sigma**2 * tf.exp(-d / 2)
+    r = tf.sqrt(5 * d + 1e-12)
+    return sigma**2 * (1 + r + r**2 / 3) * tf.exp(-r)
+
+def from_sklearn(gp, dim):
+    # a fitted sklearn GaussianProcessRegressor with a Matern(nu=2.5) kernel (bayes_opt's GP) as a
+    # GaussianProcess with the same posterior. normalize_y is folded into sigma, mean, L and alpha;
+    # its per-point alpha (noise) is already part of L_.
+    std, mean = float(np.atleast_1d(gp._y_train_std)[0]), float(np.atleast_1d(gp._y_train_mean)[0])
+    GP = GaussianProcess(dim, Matern52(sigma=std, theta=gp.kernel_.length_scale),
+                         mean_function=lambda x: np.full(x.shape[0], mean))
+    GP.X, GP.Y = gp.X_train_, gp.y_train_ * std + mean
+    GP.mean = GP.mean_function(GP.X)
+    GP.L, GP.alpha = gp.L_ * std, gp.alpha_.reshape(-1) / std
+    return GP
+
+class EIOptimizer:
+    # pbounds: {"name": (low, high)} in the column order the GP was fitted with. The GP (observations,
+    # Cholesky factor, alpha, kernel parameters) enters the traced functions as tensor arguments with an
+    # open number of observations, so the whole search runs on one trace: update(GP) after each new
+    # observation only swaps the tensors.
+    def __init__(self, GP, pbounds, zeta=0., n_starts=256, n_candidates=4096, iterations=100, lr=0.05):
+        self.names = list(pbounds)
+        D = len(self.names)
+        self.lower = tf.constant([pbounds[k][0] for k in self.names], tf.float64)
+        self.width = tf.constant([pbounds[k][1] - pbounds[k][0] for k in self.names], tf.float64)
+        self.n_starts = n_starts
+        self.n_candidates = n_candidates
+        self.iterations = iterations
+        self.lr = lr
+        self.zeta = zeta
+        self.kind = type(GP.kernel)
+        if self.kind not in (RBF, Matern52):
+            raise ValueError(f"No TensorFlow version of kernel {GP.kernel!r}")
+
+        spec = lambda *shape: tf.TensorSpec(shape, tf.float64)
+        # u, then the GP: X, L, alpha, kernel scale, kernel sigma, prior mean, prior variance, mu_max
+        signature = [spec(None, D), spec(None, D), spec(None, None), spec(None, 1), spec(D), spec(), spec(), spec(), spec()]
+        self._ei = tf.function(self._ei_fn, input_signature=signature)
+        self._ascend = tf.function(self._ascend_fn, input_signature=signature)
+        self.cold = None   # seconds of the first propose(), tracing included
+        self.update(GP)
+
+    def update(self, GP):
+        # the GP after new observations (or a refit with other kernel parameters): no retracing
+        if type(GP.kernel) is not self.kind:
+            raise ValueError(f"EIOptimizer was traced for {self.kind.__name__}, got {GP.kernel!r}")
+        self.GP = GP
+        scale = GP.kernel.l if self.kind is RBF else GP.kernel.theta
+        self.state = [tf.constant(GP.X, tf.float64), tf.constant(GP.L, tf.float64),
+                      tf.constant(GP.alpha, tf.float64)[:, tf.newaxis],
+                      tf.constant(np.broadcast_to(scale, (len(self.names),)), tf.float64),
+                      tf.constant(GP.kernel.sigma, tf.float64),
+                      tf.constant(GP.mean_function(GP.X[:1])[0], tf.float64),   # the mean function is taken as constant
+                      tf.constant(GP._diag(GP.X[:1])[0], tf.float64),
+                      tf.constant(np.max(GP.predict(GP.X)[0]), tf.float64)]   # mu_max, one batched call
+        return self
+
+    def traces(self):
+        return self._ei.experimental_get_tracing_count() + self._ascend.experimental_get_tracing_count()
+
+    def ei(self, u):
+        # u: [S, D] in the unit box -> EI [S]
+        return self._ei(tf.convert_to_tensor(u, tf.float64), *self.state)
+
+    def _ei_fn(self, u, X, L, alpha, scale, sigma_f, prior_mean, prior_var, mu_max):
+        x = self.lower + u * self.width
+        K_s = tf_kernel(self.kind, x, X, scale, sigma_f)                    # [S, N]
+        mu = prior_mean + tf.squeeze(tf.matmul(K_s, alpha), -1)
+        v = tf.linalg.triangular_solve(L, tf.transpose(K_s), lower=True)    # [N, S]
+        sigma = tf.sqrt(tf.maximum(prior_var - tf.reduce_sum(v**2, 0), 1e-12))
+        improvement = mu - mu_max - self.zeta
+        z = improvement / sigma
+        cdf = (tf.math.erf(z / np.sqrt(2)) + 1.) / 2.
+        pdf = (1/np.sqrt(2*np.pi)) * tf.math.exp((-1/2) * z**2)
+        return improvement * cdf + sigma * pdf
+
+    def _ascend_fn(self, u, *state):
+        # projected Adam on all starts at once; starts are independent so the gradient of the sum
+        # is the per-start gradient
+        m = tf.zeros_like(u)
+        v = tf.zeros_like(u)
+        for t in tf.range(1, self.iterations + 1):
+            with tf.GradientTape() as tape:
+                tape.watch(u)
+                y = tf.reduce_sum(self._ei_fn(u, *state))
+            g = tape.gradient(y, u)
+            m = 0.9 * m + 0.1 * g
+            v = 0.999 * v + 0.001 * g**2
+            t = tf.cast(t, tf.float64)
+            u = u + self.lr * (m / (1 - 0.9**t)) / (tf.sqrt(v / (1 - 0.999**t)) + 1e-8)
+            u = tf.clip_by_value(u, 0., 1.)
+        return u, self._ei_fn(u, *state)
+
+    def propose(self, seed=None):
+        start = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        candidates = tf.constant(rng.uniform(size=(self.n_candidates, len(self.names))), tf.float64)
+        starts = tf.gather(candidates, tf.math.top_k(self.ei(candidates), self.n_starts).indices)
+        u, ei = self._ascend(starts, *self.state)
+        best = u[tf.argmax(ei)]
+        x = (self.lower + best * self.width).numpy()
+        if self.cold is None:
+            self.cold = time.perf_counter() - start
+        return dict(zip(self.names, x.tolist())), float(tf.reduce_max(ei))
+
+if __name__ == "__main__":
+    pbounds = {"lr": (1e-4, 1), "warmup_steps": (2000, 10000), "pretrain_steps": (1, 15), "eps": (1, 50), "alpha": (1, 5)}
+    lower, upper = np.array([b[0] for b in pbounds.values()]), np.array([b[1] for b in pbounds.values()])
+    X = np.random.uniform(lower, upper, (70, 5))
+    Y = np.random.uniform(0.9, 1., 70)
+    GP = GaussianProcess(5, kernel=Matern52(1., (upper - lower) / 4), noise_var=1e-4).fit(X[:50], Y[:50])
+    optimizer = EIOptimizer(GP, pbounds)
+    params, ei = optimizer.propose(seed=0)
+    print(f"cold call (tracing): {optimizer.cold * 1e3:.1f} ms")
+    # a BO loop: one new observation per iteration, the optimiser keeps its trace
+    times = []
+    for i in range(50, 70):
+        optimizer.update(GP.add_observation(X[i], Y[i]))
+        start = time.perf_counter()
+        params, ei = optimizer.propose(seed=i)
+        times.append(time.perf_counter() - start)
+    print(f"proposed {params} (EI {ei:.4g}); {len(times)} iterations on 51-70 observations: "
+          f"median {np.median(times) * 1e3:.1f} ms, {optimizer.traces()} traces in total")
@@ -0,0 +1,80 @@
+import tensorflow as tf
+import numpy as np
+
+N_MELS = 128  # librosa default; a gain of g dB moves MFCC c0 by g * sqrt(N_MELS)
+
+class AugmentConfig:
+    def __init__(self, input_type="mfcc", p=0.5, max_shift=0.1, gain_db=6., noise_std=0.05,
+                 time_masks=2, time_mask_width=10, freq_masks=1, freq_mask_width=3):
+        if input_type not in ("mfcc", "audio"):
+            raise ValueError(f"Unknown input type: {input_type}")
+        self.input_type = input_type
+        self.p = p                              # probability of each transform per example
+        self.max_shift = max_shift              # fraction of the sequence length
+        self.gain_db = gain_db
+        self.noise_std = noise_std              # relative to the per-example std
+        self.time_masks = time_masks            # SpecAugment, mfcc only
+        self.time_mask_width = time_mask_width
+        self.freq_masks = freq_masks
+        self.freq_mask_width = freq_mask_width
+
+def _coin(batch_size, p):
+    return tf.cast(tf.random.uniform((batch_size,)) < p, tf.float32)
+
+def _expand(v, rank):
+    return tf.reshape(v, [-1] + [1] * (rank - 1))
+
+def time_shift(x, max_shift, p):
+    # circular shift of every example by its own offset, as one gather
+    B, T = tf.shape(x)[0], tf.shape(x)[1]
+    limit = tf.maximum(tf.cast(tf.cast(T, tf.float32) * max_shift, tf.int32), 1)
+    shift = tf.random.uniform((B,), -limit, limit + 1, dtype=tf.int32)
+    shift *= tf.cast(_coin(B, p), tf.int32)
+    idx = (tf.range(T)[tf.newaxis, :] - shift[:, tf.newaxis]) % T
+    return tf.gather(x, idx, batch_dims=1)
+
+def gain(x, gain_db, p, input_type):
+    B = tf.shape(x)[0]
+    g = tf.random.uniform((B,), -gain_db, gain_db) * _coin(B, p)
+    if input_type == "audio":
+        return x * _expand(10. ** (g / 20.), len(x.shape))
+    c0 = tf.one_hot(0, tf.shape(x)[-1])
+    return x + g[:, tf.newaxis, tf.newaxis] * float(np.sqrt(N_MELS)) * c0
+
+def add_noise(x, noise_std, p):
+    rank = len(x.shape)
+    std = tf.math.reduce_std(x, axis=list(range(1, rank)), keepdims=True)
+    return x + tf.random.normal(tf.shape(x)) * std * noise_std * _expand(_coin(tf.shape(x)[0], p), rank)
+
+def _masks(B, size, n, width, p):
+    # [B, size] with 0 on n random bands of up to `width` bins
+    w = tf.random.uniform((B, n), 0, width + 1, dtype=tf.int32)
+    start = tf.random.uniform((B, n), 0, tf.maximum(size - width, 1), dtype=tf.int32)
+    pos = tf.range(size)[tf.newaxis, tf.newaxis, :]
+    hit = (pos >= start[..., tf.newaxis]) & (pos < (start + w)[..., tf.newaxis])
+    hit = tf.reduce_any(hit, axis=1) & (_coin(B, p)[:, tf.newaxis] > 0)
+    return 1. - tf.cast(hit, tf.float32)
+
+def spec_augment(x, config):
+    B, T, F = tf.shape(x)[0], tf.shape(x)[1], tf.shape(x)[2]
+    mask = tf.ones((B, T, F))
+    if config.time_masks:
+        mask *= _masks(B, T, config.time_masks, config.time_mask_width, config.p)[:, :, tf.newaxis]
+    if config.freq_masks:
+        mask *= _masks(B, F, config.freq_masks, config.freq_mask_width, config.p)[:, tf.newaxis, :]
+    return x * mask
+
+def augment_batch(x, config):
+    # x: [B, T, F] mfcc or [B, T] / [B, T, 1] audio
+    x = time_shift(x, config.max_shift, config.p)
+    x = gain(x, config.gain_db, config.p, config.input_type)
+    x = add_noise(x, config.noise_std, config.p)
+    if config.input_type == "mfcc":
+        x = spec_augment(x, config)
+    return x
+
+def augment_dataset(dataset, config):
+    # runs on the tf.data threads, overlapped with the training step by prefetch
+    dataset = dataset.map(lambda x, y: (augment_batch(x, config), y),
+                          num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    return dataset.prefetch(tf.data.AUTOTUNE)
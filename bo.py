@@ -0,0 +1,353 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import uuid
+import functools
+import warnings
+import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from bayes_opt import BayesianOptimization, UtilityFunction
+from bayes_opt.logger import JSONLogger
+from bayes_opt.event import Events
+from scheduler import ASHA
+from registry import Registry, hyperparameter_dict
+from pretrain_cache import PretrainCache
+
+pbounds = {"lr": (1e-4, 1), "warmup_steps": (2000, 10000), "pretrain_steps": (1, 15), "eps": (1, 50), "alpha": (1, 5)}
+
+def p_evaluation(lr, warmup_steps, pretrain_steps, eps, alpha, data_path="mfcc.npz", folds=3, epochs=1000,
+                 scheduler=None, max_folds=None, subset=1., registry=None, pretrain_cache="pretrain_cache"):
+    # max_folds / subset give cheaper, lower-fidelity evaluations: only the first max_folds of the
+    # k-fold splits, trained on the first subset fraction of each training split (classes are
+    # interleaved, so any prefix stays balanced). registry: path of a registry.Registry database,
+    # pretrain_cache: directory of the shared pretraining cache, None to always pretrain
+    from training import make_dataset, evaluate   # TensorFlow is only loaded inside the workers
+    X = np.load(data_path)['X'][0:900]
+    Y = np.load(data_path)['Y'][0:900]  # fold_1
+    hyperparameters = (64, [64, 32], 5, (137, 15), 32, epochs, lr, int(warmup_steps), int(pretrain_steps), eps, alpha)
+    trial = uuid.uuid4().hex
+    cache = None if pretrain_cache is None else PretrainCache(pretrain_cache)
+    results = []
+    trained = 0
+    stopped = False
+    for fold, (X_train, Y_train, X_test, Y_test) in enumerate(make_dataset(X, Y, folds)):
+        if max_folds is not None and fold >= max_folds:
+            break
+        n = int(len(X_train) * subset)
+        X_train, Y_train = X_train[:n], Y_train[:n]
+        report = None if scheduler is None else scheduler.reporter(trial, bracket=f"fold{fold}")
+        run = None
+        if registry is not None:
+            params = {**hyperparameter_dict(hyperparameters), "folds": folds, "subset": subset}
+            run = Registry(registry).start_run(params, name="bo", fold=fold, source=trial)
+        results.append(evaluate(X_train, Y_train, X_test, Y_test, hyperparameters, report=report, run=run,
+                                pretrain_cache=cache))
+        if report is not None:
+            trained += report.epochs
+            if report.stopped:    # a stopped trial scores on the folds it got through
+                stopped = True
+                break
+    if scheduler is not None:
+        scheduler.finish(trial, trained, epochs * (max_folds or folds), stopped)
+    return float(sum(results) / len(results))
+
+def load_prior_logs(paths, fold_weights=None):
+    # JSONLogger files -> [(params, target, weight)]; fold_weights maps the fold number in the file
+    # name (Bayessian_logs_fold_4.json -> 4) to a weight, points probed in several folds are merged
+    merged = {}
+    for path in paths:
+        m = re.search(r"fold_?(\d+)", os.path.basename(path))
+        weight = 1. if fold_weights is None or m is None else fold_weights.get(int(m.group(1)), 0.)
+        if weight <= 0:
+            continue
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                res = json.loads(line)
+                key = tuple(sorted(res["params"].items()))
+                target, total = merged.get(key, (0., 0.))
+                merged[key] = (target + weight * res["target"], total + weight)
+    return [(dict(key), target / total, total) for key, (target, total) in merged.items()]
+
+def _init_worker(threads):
+    if threads:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def _timed(f, params):
+    start = time.perf_counter()
+    target = f(**params)
+    return target, time.perf_counter() - start
+
+class ParallelBayesianOptimization:
+    # Constant-liar batch BO: while q evaluations are running, each one is registered with a fake
+    # target (the worst one seen so far) on a copy of the GP, so the next suggestion moves elsewhere.
+    # priors: output of load_prior_logs, observations from earlier searches that seed the GP. They are
+    # fitted with extra noise prior_noise / weight, so new evaluations override them where they disagree.
+    # acquisition="tf": EI is maximised by acquisition.EIOptimizer on bayes_opt's fitted GP instead of
+    # bayes_opt's random sampling + L-BFGS-B; one optimiser is kept, so it is traced once per search.
+    def __init__(self, f, pbounds, n_workers=4, threads_per_worker=None, random_state=None,
+                 log_path=None, kind="ei", kappa=2.576, xi=0.0, priors=(), prior_noise=0.05, acquisition="bayes_opt"):
+        if acquisition not in ("bayes_opt", "tf"):
+            raise ValueError(f"Unknown acquisition optimiser: {acquisition}")
+        if acquisition == "tf" and kind != "ei":
+            raise ValueError("acquisition='tf' only maximises expected improvement (kind='ei')")
+        self.f = f
+        self.pbounds = pbounds
+        self.acquisition = acquisition
+        self.ei_optimizer = None
+        self.suggest_times = []
+        self.n_workers = n_workers
+        self.threads_per_worker = threads_per_worker
+        self.random_state = np.random.RandomState(random_state)
+        self.optimizer = BayesianOptimization(f=None, pbounds=pbounds, random_state=self.random_state, verbose=2)
+        self.utility = UtilityFunction(kind=kind, kappa=kappa, xi=xi)
+        self.timings = []
+        self.prior_alpha = []
+        for params, target, weight in priors:   # registered before the logger so they are not logged again
+            params = {key: params[key] for key in pbounds}
+            try:
+                self.optimizer.register(params=params, target=target)
+            except Exception:   # same point after dropping unused keys
+                continue
+            self.prior_alpha.append(prior_noise / weight)
+        if log_path is not None:
+            # same event stream as optimizer.maximize, so the JSON files read back the same way
+            self.optimizer.subscribe(Events.OPTIMIZATION_STEP, JSONLogger(path=log_path))
+
+    def register(self, params, target):
+        self.optimizer.register(params=params, target=target)
+
+    def _set_noise(self, optimizer):
+        n_new = len(optimizer.space) - len(self.prior_alpha)
+        optimizer.set_gp_params(alpha=np.concatenate([self.prior_alpha, np.full(n_new, 1e-6)]))
+
+    def _suggest(self, optimizer):
+        start = time.perf_counter()
+        if self.acquisition == "bayes_opt":
+            params = optimizer.suggest(self.utility)
+        else:
+            from acquisition import EIOptimizer, from_sklearn   # TensorFlow, only when asked for
+            with warnings.catch_warnings():   # the same GP fit as BayesianOptimization.suggest
+                warnings.simplefilter("ignore")
+                optimizer._gp.fit(optimizer.space.params, optimizer.space.target)
+            GP = from_sklearn(optimizer._gp, len(self.pbounds))
+            if self.ei_optimizer is None:
+                # bayes_opt orders the GP's columns by space.keys
+                pbounds = {key: self.pbounds[key] for key in optimizer.space.keys}
+                self.ei_optimizer = EIOptimizer(GP, pbounds, zeta=self.utility.xi)
+            else:
+                self.ei_optimizer.update(GP)
+            params, _ = self.ei_optimizer.propose(seed=self.random_state.randint(2**31))
+        self.suggest_times.append(time.perf_counter() - start)
+        return params
+
+    def suggest(self, pending=()):
+        if len(self.optimizer.space) == 0:
+            return self.optimizer.space.array_to_params(self.optimizer.space.random_sample())
+        if not pending:
+            self._set_noise(self.optimizer)
+            return self._suggest(self.optimizer)
+        lie = self.optimizer.space.target.min()
+        liar = BayesianOptimization(f=None, pbounds=self.pbounds, random_state=self.random_state, verbose=0)
+        for res in self.optimizer.res:
+            liar.register(params=res["params"], target=res["target"])
+        for params in pending:
+            try:
+                liar.register(params=params, target=lie)
+            except Exception:   # already observed (the error type differs across bayes_opt versions)
+                pass
+        self._set_noise(liar)
+        return self._suggest(liar)
+
+    def best(self):
+        # best point evaluated in this search, priors excluded
+        new = self.optimizer.res[len(self.prior_alpha):]
+        return max(new, key=lambda res: res["target"]) if new else None
+
+    def maximize(self, init_points=5, n_iter=20, probes=()):
+        queue = [dict(p) for p in probes]
+        queue += [self.optimizer.space.array_to_params(self.optimizer.space.random_sample()) for _ in range(init_points)]
+        total = len(queue) + n_iter
+
+        start = time.perf_counter()
+        pending = {}
+        submitted = 0
+        with ProcessPoolExecutor(self.n_workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(self.threads_per_worker,)) as pool:
+            while submitted < total or pending:
+                while submitted < total and len(pending) < self.n_workers:
+                    params = queue.pop(0) if queue else self.suggest(list(pending.values()))
+                    pending[pool.submit(_timed, self.f, params)] = params
+                    submitted += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    params = pending.pop(future)
+                    target, elapsed = future.result()
+                    self.timings.append(elapsed)
+                    self.register(params, target)
+        self.wall = time.perf_counter() - start
+        wall = self.wall
+
+        # not a serial baseline: each evaluation ran on threads_per_worker threads, so it took longer than it
+        # would alone on every core. Run with --serial-baseline for a measured comparison.
+        evaluating = sum(self.timings)
+        print(f"{len(self.timings)} evaluations, wall {wall:.1f}s, sum of evaluation times {evaluating:.1f}s "
+              f"({evaluating / wall:.2f}x wall with {self.n_workers} workers x {self.threads_per_worker} threads)")
+        if self.suggest_times:
+            line = f"{len(self.suggest_times)} suggestions ({self.acquisition}): median {np.median(self.suggest_times) * 1e3:.0f}ms"
+            if self.ei_optimizer is not None:
+                line += f", first (tracing) {self.ei_optimizer.cold * 1e3:.0f}ms, {self.ei_optimizer.traces()} traces"
+            print(line)
+        return self.best()
+
+def evaluations_to_reach(log_path, target):
+    # number of full-fidelity evaluations the logged search needed before its first result >= target
+    with open(log_path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for i, res in enumerate(rows):
+        if res["target"] >= target:
+            return i + 1
+    return None
+
+class MultiFidelitySearch:
+    # BO runs on cheap evaluations (low: keyword overrides for f, e.g. one fold, fewer epochs, part of
+    # the training data) and only the most promising points are re-run at full fidelity (high).
+    # High-fidelity targets are modelled as rho * low + delta(x) (autoregressive co-kriging): rho comes
+    # from a linear fit over the promoted points, delta is a GP over the normalised parameters, so
+    # points are promoted on their predicted full-fidelity score rather than their raw cheap one.
+    def __init__(self, f, pbounds, low, high=None, n_workers=4, threads_per_worker=1, random_state=None,
+                 log_path=None, kappa=1.):
+        self.pbounds = pbounds
+        self.high_f = functools.partial(f, **(high or {}))
+        self.n_workers = n_workers
+        self.threads_per_worker = threads_per_worker
+        self.kappa = kappa
+        self.bo = ParallelBayesianOptimization(functools.partial(f, **low), pbounds, n_workers=n_workers,
+                                               threads_per_worker=threads_per_worker, random_state=random_state,
+                                               log_path=log_path)
+        self.high = []            # (params, low target, high target)
+        self.high_timings = []
+        self.trace = []           # (CPU-hours so far, best high-fidelity target) after each round
+
+    def _x(self, params_list):
+        lower = np.array([self.pbounds[k][0] for k in self.pbounds])
+        upper = np.array([self.pbounds[k][1] for k in self.pbounds])
+        return (np.array([[p[k] for k in self.pbounds] for p in params_list]) - lower) / (upper - lower)
+
+    def correlation(self):
+        if len(self.high) < 3:
+            return None
+        _, low, high = zip(*self.high)
+        return float(np.corrcoef(low, high)[0, 1])
+
+    def predict_high(self, params_list, low):
+        # -> mean, std of the full-fidelity target; before enough pairs exist, the cheap score itself
+        low = np.asarray(low, dtype=float)
+        if len(self.high) < 3:
+            return low, np.zeros(len(low))
+        from gaussian_process import GaussianProcess, Matern52
+        params, l, h = zip(*self.high)
+        l, h = np.array(l), np.array(h)
+        rho, c = np.polyfit(l, h, 1)
+        delta = h - rho * l
+        GP = GaussianProcess(len(self.pbounds), Matern52(sigma=max(float(np.std(delta)), 1e-3), theta=0.3),
+                             mean_function=lambda x: np.full(x.shape[0], c), noise_var=1e-4)
+        GP.fit(self._x(params), delta)
+        mu, var = GP.predict(self._x(params_list))
+        return rho * low + mu, np.sqrt(var)
+
+    def promote(self, k):
+        promoted = {tuple(sorted(p.items())) for p, _, _ in self.high}
+        candidates = [res for res in self.bo.optimizer.res if tuple(sorted(res["params"].items())) not in promoted]
+        if not candidates:
+            return
+        mu, std = self.predict_high([res["params"] for res in candidates], [res["target"] for res in candidates])
+        order = np.argsort(-(mu + self.kappa * std))[:k]
+        chosen = [candidates[i] for i in order]
+        with ProcessPoolExecutor(min(self.n_workers, len(chosen)), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(self.threads_per_worker,)) as pool:
+            futures = [pool.submit(_timed, self.high_f, res["params"]) for res in chosen]
+            for res, future in zip(chosen, futures):
+                target, elapsed = future.result()
+                self.high_timings.append(elapsed)
+                self.high.append((res["params"], res["target"], target))
+
+    def cpu_hours(self):
+        return (sum(self.bo.timings) + sum(self.high_timings)) * (self.threads_per_worker or 1) / 3600
+
+    def best(self):
+        return max(self.high, key=lambda h: h[2]) if self.high else None
+
+    def run(self, rounds=5, init_points=5, n_low=10, promote=2, target=None):
+        for r in range(rounds):
+            self.bo.maximize(init_points=init_points if r == 0 else 0, n_iter=n_low)
+            self.promote(promote)
+            best = self.best()
+            self.trace.append((self.cpu_hours(), best[2]))
+            corr = self.correlation()
+            print(f"round {r}: {len(self.bo.timings)} low / {len(self.high)} high evaluations, "
+                  f"{self.cpu_hours():.2f} CPU-hours, best {best[2]:.4f}"
+                  + ("" if corr is None else f", low/high correlation {corr:.2f}"))
+            if target is not None and best[2] >= target:
+                break
+        return self.best()
+
+    def report(self, target, baseline_evaluations):
+        # CPU-hours until the best known target was matched, against a full-fidelity-only search that
+        # needed baseline_evaluations runs, each costing what a high-fidelity run costs here
+        reached = next((hours for hours, best in self.trace if best >= target), None)
+        full = baseline_evaluations * np.mean(self.high_timings) * (self.threads_per_worker or 1) / 3600
+        print(f"full fidelity only: {baseline_evaluations} evaluations, ~{full:.2f} CPU-hours to reach {target:.4f}")
+        if reached is None:
+            print(f"multi-fidelity: not reached, {self.cpu_hours():.2f} CPU-hours spent")
+        else:
+            print(f"multi-fidelity: {reached:.2f} CPU-hours ({reached / full:.1%} of full fidelity)")
+
+if __name__ == "__main__":
+    n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = max(multiprocessing.cpu_count() // n_workers, 1)
+    scheduler = ASHA("asha.db", grace_period=100, max_epochs=1000) if "--asha" in sys.argv else None
+    f = functools.partial(p_evaluation, scheduler=scheduler, registry="runs.db")
+    if "--multi-fidelity" in sys.argv:
+        # cheap runs: one fold, 200 epochs, half the training split; promote two points per round
+        log = "Config-Nov-17-2023/Bayessian_logs_fold1.json"
+        target = max(target for _, target, _ in load_prior_logs([log]))   # best configuration so far
+        search = MultiFidelitySearch(p_evaluation, pbounds, low={"max_folds": 1, "epochs": 200, "subset": 0.5},
+                                     n_workers=n_workers, threads_per_worker=threads, random_state=4,
+                                     log_path="./Bayessian_logs_low_fidelity.json")
+        print(search.run(rounds=10, init_points=5, n_low=10, promote=2, target=target))
+        search.report(target, evaluations_to_reach(log, target))
+        sys.exit()
+    if "--warm-start" in sys.argv:
+        # earlier 10-fold searches; this search runs on fold_1, so that fold counts the most
+        priors = load_prior_logs(glob.glob("Config-Nov-17-2023/Bayessian_logs_fold*.json"),
+                                 fold_weights={fold: 1. if fold == 1 else 0.5 for fold in range(1, 11)})
+        init_points, probes = 0, []
+    else:
+        priors = []
+        init_points, probes = 5, [{"lr": 0.115, "warmup_steps": 6000, "pretrain_steps": 2, "eps": 35, "alpha": 1}]
+    acquisition = "tf" if "--tf-acquisition" in sys.argv else "bayes_opt"
+    optimizer = ParallelBayesianOptimization(f, pbounds, n_workers=n_workers, threads_per_worker=threads,
+                                             random_state=4, log_path="./Bayessian_logs.json", priors=priors,
+                                             acquisition=acquisition)
+    print(optimizer.maximize(init_points=init_points, n_iter=20, probes=probes))
+    if scheduler is not None:
+        scheduler.summary(optimizer.wall)
+    if "--serial-baseline" in sys.argv:
+        # the same budget, one point at a time on every core: the loop this search replaces
+        # its own ASHA search, so the serial trials are not ranked against the parallel ones
+        serial_f = functools.partial(p_evaluation, registry="runs.db",
+                                     scheduler=None if scheduler is None else ASHA("asha.db", grace_period=100,
+                                                                                   max_epochs=1000))
+        serial = ParallelBayesianOptimization(serial_f, pbounds, n_workers=1, threads_per_worker=multiprocessing.cpu_count(),
+                                              random_state=4, priors=priors, acquisition=acquisition)
+        serial.maximize(init_points=init_points, n_iter=20, probes=probes)
+        print(f"measured: serial {serial.wall:.1f}s, parallel {optimizer.wall:.1f}s, "
+              f"speedup {serial.wall / optimizer.wall:.2f}x with {n_workers} workers")
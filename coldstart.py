@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+START = time.perf_counter()
+
+# Inference entry point for short-lived workers:
+#   python coldstart.py export/saved_model recording.wav|features.npy   (SavedModel from export.py)
+#   python coldstart.py export/model.tflite features.npy
+# Nothing heavy is imported at module level: no Keras model is built and nothing is traced, the
+# serving signature traced by export.py is loaded from disk and run once on zeros (warm-up) before
+# the real input. The time from process start to the first prediction is stored in the run registry.
+
+def process_age():
+    # seconds since the process started, including interpreter start-up (Linux), else since import
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - START
+
+class SavedModelPredictor:
+    def __init__(self, path):
+        import tensorflow as tf
+        self.tf = tf
+        self.signature = tf.saved_model.load(path).signatures["serving_default"]
+        self.input_shape = tuple(self.signature.structured_input_signature[1]["x"].shape)
+
+    def __call__(self, x):
+        return self.signature(x=self.tf.constant(x))["probabilities"].numpy()
+
+class TFLitePredictor:
+    def __init__(self, path):
+        try:
+            from tflite_runtime.interpreter import Interpreter   # much lighter than TensorFlow when installed
+        except ImportError:
+            import tensorflow as tf   # tf.lite is a lazily loaded attribute, not an importable module
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        details = self.interpreter.get_input_details()[0]
+        self.input, self.input_shape = details["index"], tuple(details["shape"])
+        self.output = self.interpreter.get_output_details()[0]["index"]
+
+    def __call__(self, x):
+        self.interpreter.set_tensor(self.input, x)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output)
+
+def load_input(path):
+    import numpy as np
+    if path.endswith(".npy"):
+        return np.load(path).astype(np.float32)
+    from features import MAXLEN, load_wav, pad_sequence, mfcc   # librosa, only for audio input; framed as in training
+    return mfcc(pad_sequence([load_wav(path)], maxlen=MAXLEN))[0]
+
+def main(model_path, input_path, registry="runs.db"):
+    import numpy as np
+    timings = {"imports": time.perf_counter() - START}
+    t = time.perf_counter()
+    predictor = (TFLitePredictor if model_path.endswith(".tflite") else SavedModelPredictor)(model_path)
+    timings["load"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    predictor(np.zeros(predictor.input_shape, dtype=np.float32))   # first run allocates and optimises the graph
+    timings["warmup"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    x = load_input(input_path)
+    timings["features"] = time.perf_counter() - t
+    if x.shape != predictor.input_shape[1:]:
+        raise ValueError(f"{input_path}: expected features of shape {predictor.input_shape[1:]}, got {x.shape}"
+                         + ("" if input_path.endswith(".npy") else " (features.SR / MAXLEN / HOP differ from training)"))
+    t = time.perf_counter()
+    probs = predictor(x[None])[0]
+    timings["predict"] = time.perf_counter() - t
+    timings["time_to_first_prediction"] = process_age()
+
+    print(f"prediction {int(np.argmax(probs))} {np.round(probs, 4).tolist()}")
+    print(" ".join(f"{k}={v * 1e3:.0f}ms" for k, v in timings.items()))
+    if registry is not None:
+        from registry import Registry
+        Registry(registry).add_run({"entry": "coldstart", "model": os.path.abspath(model_path)}, None,
+                                   name="coldstart", history={k: [v] for k, v in timings.items()})
+    return probs, timings
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,87 @@
+import sys
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from training import TrainingEngine, build_model, build_conv_student, loss_fn
+from infer import load_checkpoint, predict
+
+# Knowledge distillation of the VAT-trained model into a smaller student, trained by the same
+# TrainingEngine.evaluate pipeline (pretraining, optional VAT, best-validation test accuracy):
+#   python distill.py training_1/cp.ckpt [small|one-block|conv] [--vat]
+# The student's supervised loss mixes the labels with the teacher's temperature-softened predictions.
+
+STUDENTS = {"small": dict(d_model=32, num_heads=[16, 8]),
+            "one-block": dict(d_model=64, num_heads=[32]),
+            "conv": dict(d_model=32, num_heads=[0, 0], build_fn=build_conv_student)}
+
+def soften(probs, temperature):
+    # the models output softmax probabilities, not logits
+    return tf.nn.softmax(tf.math.log(probs + 1e-8) / temperature, axis=-1)
+
+class DistillationEngine(TrainingEngine):
+    def __init__(self, teacher, temperature=4., weight=0.7, **kwargs):
+        self.teacher = teacher
+        self.temperature = temperature
+        self.weight = weight   # share of the soft-target term
+        super().__init__(**kwargs)
+
+    def loss(self, x, y, logits):
+        soft_targets = soften(self.teacher(x, training=False), self.temperature)
+        kd = tf.reduce_mean(keras.losses.kl_divergence(soft_targets, soften(logits, self.temperature)))
+        # T^2 keeps the soft-target gradients on the scale of the hard-label ones
+        return (1 - self.weight) * loss_fn(y, logits) + self.weight * self.temperature**2 * kd
+
+def latency(model, x, repeats=100):
+    step = tf.function(lambda x: model(x, training=False))
+    step(x)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        step(x).numpy()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1e3
+
+def single_sample(model, build_fn, input_shape, **params):
+    # same weights in a batch_size=1 build, for gateway-style latency
+    copy = build_fn(input_shape=input_shape, batch_size=1, **params)
+    copy.set_weights(model.get_weights())
+    return copy
+
+def distill(teacher_checkpoint, X_train, Y_train, X_test, Y_test, student="small", vat=False, epochs=300, lr=0.115,
+            warmup_steps=6000, pretrain_steps=2, eps=35., alpha=1., batch_size=32, temperature=4., weight=0.7,
+            teacher_params=None):
+    input_shape = tuple(X_train.shape[1:])
+    teacher_params = teacher_params or {}
+    teacher = load_checkpoint(teacher_checkpoint, batch_size, input_shape=input_shape, **teacher_params)
+    params = dict(STUDENTS[student])
+    build_fn = params.pop("build_fn", build_model)
+    engine = DistillationEngine(teacher, temperature, weight, input_shape=input_shape, batch_size=batch_size,
+                                build_fn=build_fn, **params)
+    # the batch_size=1 copies are built (and the teacher timed) before training, so a build that does not
+    # match fails before the distillation run instead of after it
+    x = tf.constant(np.asarray(X_test[:1]), tf.float32)
+    teacher_ms = latency(load_checkpoint(teacher_checkpoint, 1, input_shape=input_shape, **teacher_params), x)
+    student_single = single_sample(engine.model, build_fn, input_shape, **params)
+    student_acc = engine.evaluate(X_train, Y_train, X_test, Y_test, epochs, lr, warmup_steps, pretrain_steps, eps,
+                                  alpha, vat=vat)
+
+    x_test, y_test = X_test[len(X_test) // 2:], Y_test[len(X_test) // 2:]   # the split evaluate() scores on
+    teacher_acc = float(np.mean(np.argmax(predict(teacher, np.asarray(x_test), batch_size), -1) == np.asarray(y_test)))
+
+    student_single.set_weights(engine.model.get_weights())
+    rows = [("teacher", teacher_acc, teacher.count_params(), teacher_ms),
+            (f"student ({student}{', VAT' if vat else ''})", float(student_acc), engine.model.count_params(),
+             latency(student_single, x))]
+    print(f"{'model':<26}{'accuracy':>10}{'params':>10}{'ms/sample':>11}")
+    for name, acc, n_params, ms in rows:
+        print(f"{name:<26}{acc:>10.3f}{n_params:>10d}{ms:>11.2f}")
+    return rows
+
+if __name__ == "__main__":
+    checkpoint = sys.argv[1]
+    student = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith("--") else "small"
+    data = np.load("mfcc.npz")
+    X, Y = data["X"].astype(np.float32), data["Y"]
+    # fold1: train on [0:900], validate / test on the two halves of [900:1000]
+    distill(checkpoint, X[0:900], Y[0:900], X[900:1000], Y[900:1000], student=student, vat="--vat" in sys.argv)
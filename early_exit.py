@@ -0,0 +1,154 @@
+import sys
+import time
+import inspect
+import functools
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+import layers as default_layers
+from training import TrainingEngine, build_model, loss_fn
+from infer import load_checkpoint, load_layers
+
+# Early exit after the first attention + FeedForward block:
+#   python early_exit.py training_1/cp.ckpt                  exit head on the frozen backbone
+#   python early_exit.py training_1/cp.ckpt --joint [epochs]  backbone and exit head fine-tuned together
+# An auxiliary classifier reads the pooled output of the first block. At inference a recording whose
+# auxiliary confidence reaches the threshold skips the remaining blocks. By default the auxiliary head is
+# trained on the frozen backbone of a trained model, so the full network's predictions do not change.
+# --joint then fine-tunes build_model(early_exit=True) from the checkpoint and that exit head with the
+# TrainingEngine pipeline (VAT, best-validation test accuracy) on the sum of both cross-entropies, so the
+# first block also learns features the exit head can use.
+
+THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+class EarlyExitModel:
+    # layers: the layers module of the backbone (infer.load_layers); serving needs one that supports it
+    def __init__(self, d_model=64, num_heads=[64, 32], classes=5, input_shape=(137, 15), batch_size=1, serving=True,
+                 layers=None):
+        layers = layers or default_layers
+        if serving and "serving" not in inspect.signature(layers.MultiHeadSelfAttention).parameters:
+            raise ValueError(f"{layers.__name__}.MultiHeadSelfAttention has no serving option")
+        options = {"serving": True} if serving else {}
+        inputs = keras.layers.Input(shape=input_shape, batch_size=batch_size)
+        self.embedding = layers.PositionalEmbedding(d_model=d_model)
+        self.blocks = [(layers.MultiHeadSelfAttention(d_model=d_model, num_heads=n_heads, **options),
+                        layers.FeedForward(d_model=d_model)) for n_heads in num_heads]
+        self.pool = keras.layers.GlobalAveragePooling1D(data_format="channels_first")
+        self.head = keras.layers.Dense(classes, activation='softmax')
+        self.exit_head = keras.layers.Dense(classes, activation='softmax')
+
+        attention, feed_forward = self.blocks[0]
+        h = feed_forward(attention(self.embedding(inputs)))
+        self.stage1 = keras.Model(inputs, [h, self.exit_head(self.pool(h))])   # -> hidden state, auxiliary probs
+        h_in = keras.layers.Input(shape=h.shape[1:], batch_size=batch_size)
+        x = h_in
+        for attention, feed_forward in self.blocks[1:]:
+            x = feed_forward(attention(x))
+        self.stage2 = keras.Model(h_in, self.head(self.pool(x)))               # -> final probs
+        self._stage1 = tf.function(lambda x: self.stage1(x, training=False))
+        self._stage2 = tf.function(lambda h: self.stage2(h, training=False))
+
+    def load_backbone(self, model):
+        # weights of a trained build_model network, layer by layer in build order; the exit head too when
+        # the network was built with early_exit=True
+        source = [l for l in model.layers if l.weights and l.name != "exit_head"]
+        target = [self.embedding] + [l for block in self.blocks for l in block] + [self.head]
+        for src, dst in zip(source, target):
+            dst.set_weights(src.get_weights())
+        if "exit_head" in [l.name for l in model.layers]:
+            self.exit_head.set_weights(model.get_layer("exit_head").get_weights())
+
+    def train_exit_head(self, X, Y, epochs=200, lr=1e-2):
+        # backbone frozen: its pooled first-block features are computed once, only the exit Dense is fit
+        features = np.concatenate([self.pool(self._stage1(x[np.newaxis])[0]).numpy() for x in X])
+        head = keras.Sequential([keras.layers.Input(shape=features.shape[1:]), self.exit_head])
+        head.compile(optimizer=keras.optimizers.Adam(lr), loss=keras.losses.SparseCategoricalCrossentropy(),
+                     metrics=["accuracy"])
+        head.fit(features, Y, batch_size=64, epochs=epochs, verbose=0)
+        return head.evaluate(features, Y, verbose=0)
+
+    def __call__(self, x, threshold=0.9):
+        # one recording [1, frames, bins] -> probs, exited early?
+        h, aux = self._stage1(x)
+        if float(tf.reduce_max(aux)) >= threshold:
+            return aux.numpy()[0], True
+        return self._stage2(h).numpy()[0], False
+
+class EarlyExitEngine(TrainingEngine):
+    # build_model(early_exit=True) trained on final + exit_weight * exit cross-entropy; VAT, accuracy and
+    # validation use the final output
+    def __init__(self, exit_weight=0.3, layers=None, **kwargs):
+        self.exit_weight = exit_weight
+        super().__init__(build_fn=functools.partial(build_model, early_exit=True, layers=layers), **kwargs)
+
+    def loss(self, x, y, logits):
+        final, exit_probs = logits
+        return loss_fn(y, final) + self.exit_weight * loss_fn(y, exit_probs)
+
+    def prediction(self, logits):
+        return logits[0]
+
+def train_joint(backbone, X_train, Y_train, X_test, Y_test, exit_weight=0.3, epochs=200, lr=0.115, warmup_steps=6000,
+                pretrain_steps=0, eps=35., alpha=1., batch_size=32, layers=None, d_model=64, num_heads=[64, 32],
+                exit_head=None):
+    # fine-tunes a trained build_model network (backbone) together with an exit head (its weights, or a new one)
+    engine = EarlyExitEngine(exit_weight, layers=layers, d_model=d_model, num_heads=num_heads,
+                             classes=backbone.output_shape[-1], input_shape=X_train.shape[1:], batch_size=batch_size)
+    source = [l for l in backbone.layers if l.weights]
+    target = [l for l in engine.model.layers if l.weights and l.name != "exit_head"]
+    for src, dst in zip(source, target):
+        dst.set_weights(src.get_weights())
+    if exit_head is not None:
+        engine.model.get_layer("exit_head").set_weights(exit_head)
+    accuracy = engine.evaluate(X_train, Y_train, X_test, Y_test, epochs, lr, warmup_steps, pretrain_steps, eps, alpha,
+                               init_weights=engine.model.get_weights())
+    return engine.model, accuracy
+
+def report(model, X, Y, thresholds=THRESHOLDS, repeats=3):
+    # ms/sample: mean over the recordings of the fastest of `repeats` runs, so a busy core does not pass
+    # for a difference between thresholds
+    X = [tf.constant(x[np.newaxis], tf.float32) for x in X]
+    model(X[0], threshold=2.)   # trace both stages
+    rows = []
+    for threshold in (2.,) + tuple(thresholds):   # 2: never exit, the full network
+        times, correct, exits = [], 0, 0
+        for x, y in zip(X, Y):
+            runs = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                probs, exited = model(x, threshold)
+                runs.append(time.perf_counter() - start)
+            times.append(min(runs))
+            correct += int(np.argmax(probs) == y)
+            exits += exited
+        rows.append((threshold, np.mean(times) * 1e3, correct / len(Y), exits / len(Y)))
+    full = rows[0][1]
+    print(f"{'threshold':>10}{'ms/sample':>11}{'reduction':>11}{'accuracy':>10}{'exited':>8}")
+    for threshold, ms, acc, exit_rate in rows:
+        name = "full" if threshold > 1 else f"{threshold:.2f}"
+        print(f"{name:>10}{ms:>11.2f}{1 - ms / full:>11.1%}{acc:>10.3f}{exit_rate:>8.0%}")
+    return rows
+
+if __name__ == "__main__":
+    checkpoint = sys.argv[1]
+    data = np.load("mfcc.npz")
+    X, Y = data["X"].astype(np.float32), data["Y"]
+    layers = load_layers(checkpoint)   # the checkpoint's own layers.py (Config-Oct-9/layers.py)
+    try:
+        model = EarlyExitModel(input_shape=X.shape[1:], layers=layers)
+    except ValueError as e:   # an older layers.py without serving mode: sampled attention as in training
+        print(f"{e}, timing the training attention")
+        model = EarlyExitModel(input_shape=X.shape[1:], serving=False, layers=layers)
+    backbone = load_checkpoint(checkpoint, 1, input_shape=X.shape[1:])
+    model.load_backbone(backbone)
+    loss, acc = model.train_exit_head(X[0:900], Y[0:900])   # fold1 training split
+    print(f"exit head: training loss {loss:.3f}, accuracy {acc:.3f}")
+    if "--joint" in sys.argv:
+        report(model, X[900:1000], Y[900:1000])
+        i = sys.argv.index("--joint") + 1
+        epochs = int(sys.argv[i]) if i < len(sys.argv) else 200
+        joint, acc = train_joint(backbone, X[0:900], Y[0:900], X[900:1000], Y[900:1000], epochs=epochs, layers=layers,
+                                 exit_head=model.exit_head.get_weights())
+        print(f"joint fine-tuning: test accuracy {acc:.3f}")
+        model.load_backbone(joint)
+    report(model, X[900:1000], Y[900:1000])
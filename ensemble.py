@@ -0,0 +1,98 @@
+import os
+import sys
+import csv
+import glob
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from features import CLASSES
+from infer import load_checkpoint, list_wavs, featurize
+
+# Fold ensemble served as one graph:
+#   python ensemble.py "checkpoints/fold*/cp.ckpt" recordings/ [--vote]   classify a directory
+#   python ensemble.py "checkpoints/fold*/cp.ckpt" --bench                 latency / throughput
+# Every fold model is a branch of one Keras model over a shared input, so one call runs all members
+# (TF schedules the independent branches on its inter-op threads) on features extracted once.
+
+class EnsemblePredictor:
+    def __init__(self, checkpoints, batch_size=32, input_shape=(137, 15), serving=True, **model_params):
+        self.batch_size = batch_size
+        self.members = [self._load(path, input_shape, serving, **model_params) for path in checkpoints]
+        inputs = keras.layers.Input(shape=input_shape, batch_size=batch_size)
+        outputs = tf.stack([member(inputs) for member in self.members])   # [members, B, classes]
+        self.stacked = keras.Model(inputs, outputs)
+        self._step = tf.function(lambda x: self.stacked(x, training=False))
+
+    def _load(self, path, input_shape, serving, **model_params):
+        try:
+            return load_checkpoint(path, self.batch_size, input_shape=input_shape, serving=serving, **model_params)
+        except ValueError:   # an older layers.py without serving mode: sampled attention as in training
+            if not serving:
+                raise
+            return load_checkpoint(path, self.batch_size, input_shape=input_shape, **model_params)
+
+    def member_probs(self, X):
+        # [N, ...] -> [members, N, classes], the last batch zero padded to the static batch size
+        out = []
+        for i in range(0, len(X), self.batch_size):
+            x = X[i:i+self.batch_size]
+            n = len(x)
+            if n < self.batch_size:
+                x = np.concatenate([x, np.zeros((self.batch_size - n, *x.shape[1:]), dtype=x.dtype)])
+            out.append(self._step(tf.constant(x, tf.float32)).numpy()[:, :n])
+        return np.concatenate(out, axis=1)
+
+    def predict(self, X, method="mean"):
+        probs = self.member_probs(X)
+        if method == "vote":
+            votes = np.eye(probs.shape[-1])[np.argmax(probs, axis=-1)]
+            return votes.mean(axis=0)   # fraction of members per class
+        if method != "mean":
+            raise ValueError(f"Unknown aggregation method: {method}")
+        return probs.mean(axis=0)
+
+def find_checkpoints(pattern):
+    # a TF checkpoint is a file prefix (cp.ckpt.index, cp.ckpt.data-*), so the pattern is matched on its .index
+    checkpoints = sorted(path[:-len(".index")] for path in glob.glob(pattern + ".index"))
+    if not checkpoints:
+        raise FileNotFoundError(f"no checkpoints match {pattern}")
+    return checkpoints
+
+def benchmark(ensemble, X, repeats=50):
+    # per-batch latency of one member, the members one after another, and the stacked graph
+    single = tf.function(lambda x: ensemble.members[0](x, training=False))
+    members = [tf.function(lambda x, m=m: m(x, training=False)) for m in ensemble.members]
+    x = tf.constant(X[:ensemble.batch_size], tf.float32)
+    runs = {"single model": lambda: single(x).numpy(),
+            f"{len(members)} members in turn": lambda: [m(x).numpy() for m in members],
+            f"{len(members)} members stacked": lambda: ensemble._step(x).numpy()}
+    print(f"{'':<22}{'p50 ms/batch':>14}{'samples/s':>12}")
+    for name, run in runs.items():
+        run()   # trace
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        print(f"{name:<22}{np.median(times) * 1e3:>14.2f}{ensemble.batch_size / np.median(times):>12.1f}")
+
+if __name__ == "__main__":
+    checkpoints = find_checkpoints(sys.argv[1])
+    method = "vote" if "--vote" in sys.argv else "mean"
+    if "--bench" in sys.argv:
+        X = np.load("mfcc.npz")["X"].astype(np.float32)
+        ensemble = EnsemblePredictor(checkpoints, input_shape=X.shape[1:])
+        print(f"{len(checkpoints)} members, batch size {ensemble.batch_size}")
+        benchmark(ensemble, X)
+    else:
+        wav_dir = sys.argv[2]
+        paths = list_wavs(wav_dir)
+        X, _ = featurize(paths)   # shared by all members
+        ensemble = EnsemblePredictor(checkpoints, input_shape=X.shape[1:])
+        probs = ensemble.predict(X, method)
+        with open("ensemble_predictions.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path", "prediction"] + CLASSES)
+            for path, p in zip(paths, probs):
+                writer.writerow([os.path.relpath(path, wav_dir), CLASSES[int(np.argmax(p))]] + [f"{v:.6f}" for v in p])
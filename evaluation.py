@@ -0,0 +1,172 @@
+import os
+import sys
+import csv
+import glob
+import numpy as np
+from registry import fold_range
+
+# Metrics for every model variant and fold in one pass over stacked outputs:
+#   python evaluation.py [root]   -> Tables/metrics_*.csv, Figures/roc_curves.npz, Figures/confusion_matrices.npz
+# Outputs are stacked to probs [models, recordings, classes] in dataset order. Every function below
+# takes arbitrary leading axes, so per-fold numbers come from a [models, folds, 100, classes] view of
+# the same array instead of one sklearn call per model / fold / class.
+
+CLASSES = ["AS", "MR", "MS", "MVP", "N"]   # same order as features.CLASSES
+FOLDS = 10
+
+def load_outputs(root="."):
+    # name -> [1000, classes]: metrics/<model>/y_pred.npy, Ablation Study/<k>/fold*.npy, InceptionTime/fold*.npy
+    outputs = {}
+    for path in sorted(glob.glob(os.path.join(root, "metrics", "*", "y_pred.npy"))):
+        outputs[f"metrics/{os.path.basename(os.path.dirname(path))}"] = np.load(path)
+    ablation = os.path.join(root, "Ablation Study")
+    variants = {}
+    if os.path.exists(os.path.join(ablation, "folder_labels.csv")):
+        with open(os.path.join(ablation, "folder_labels.csv")) as f:
+            variants = {row[0]: row[1] for row in list(csv.reader(f))[1:]}
+    directories = sorted(glob.glob(os.path.join(ablation, "[0-9]*")), key=lambda d: int(os.path.basename(d)))
+    for directory in directories:
+        folds = stack_folds(directory)
+        if folds is not None:
+            key = os.path.basename(directory)
+            outputs[f"ablation/{variants.get(key, key)}"] = folds
+    folds = stack_folds(os.path.join(root, "InceptionTime"))
+    if folds is not None:
+        outputs["InceptionTime"] = folds
+    return outputs
+
+def stack_folds(directory, k=FOLDS):
+    # fold<i>.npy holds the outputs of the i-th test fold, put back at its rows (registry.fold_range)
+    paths = [os.path.join(directory, f"fold{fold}.npy") for fold in range(1, k + 1)]
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    parts = [np.load(p) for p in paths]
+    out = np.zeros((sum(len(p) for p in parts), parts[0].shape[-1]), dtype=np.float64)
+    for fold, part in enumerate(parts, 1):
+        start, end = fold_range(fold, len(out), k)
+        out[start:end] = part
+    return out
+
+def load_labels(root=".", n=1000):
+    for name in ("mfcc.npz", "mfcc_fixed.npz"):
+        if os.path.exists(os.path.join(root, name)):
+            return np.load(os.path.join(root, name))["Y"].astype(np.int64)
+    # the layout Ablation Study/main.ipynb assumes: the classes interleaved, 200 recordings each
+    return np.tile(np.arange(len(CLASSES)), n // len(CLASSES))
+
+def by_fold(a, k=FOLDS):
+    # [..., N, ...] with recordings on axis -2 (probs) -> [..., folds, N / folds, ...] in fold order
+    n = a.shape[-2]
+    rows = np.concatenate([np.arange(*fold_range(fold, n, k)) for fold in range(1, k + 1)])
+    return a[..., rows, :].reshape(*a.shape[:-2], k, n // k, a.shape[-1])
+
+def confusion_matrices(y_true, probs):
+    # y_true [..., N], probs [..., N, C] -> counts [..., C (true), C (predicted)]
+    C = probs.shape[-1]
+    y_pred = np.argmax(probs, axis=-1)
+    y_true = np.broadcast_to(y_true, y_pred.shape)
+    lead = y_pred.shape[:-1]
+    batch = np.arange(int(np.prod(lead))).reshape(lead + (1,))
+    index = (batch * C + y_true) * C + y_pred
+    return np.bincount(index.ravel(), minlength=batch.size * C * C).reshape(lead + (C, C))
+
+def _divide(a, b):
+    return np.divide(a, b, out=np.zeros(np.broadcast_shapes(np.shape(a), np.shape(b))), where=b != 0)
+
+def precision_recall_f1(cm):
+    # [..., C, C] -> precision, recall, f1, support [..., C]; plus macro / micro / weighted averages
+    tp = np.diagonal(cm, axis1=-2, axis2=-1).astype(np.float64)
+    predicted, support = cm.sum(axis=-2), cm.sum(axis=-1)
+    precision, recall = _divide(tp, predicted), _divide(tp, support)
+    f1 = _divide(2 * precision * recall, precision + recall)
+    per_class = {"precision": precision, "recall": recall, "f1": f1, "support": support}
+    weights = _divide(support, support.sum(axis=-1, keepdims=True))
+    micro = _divide(tp.sum(axis=-1), cm.sum(axis=(-2, -1)))   # = accuracy for single-label data
+    averages = {"accuracy": micro,
+                "macro": {k: v.mean(axis=-1) for k, v in per_class.items() if k != "support"},
+                "weighted": {k: (v * weights).sum(axis=-1) for k, v in per_class.items() if k != "support"}}
+    return per_class, averages
+
+def roc_curves(targets, scores):
+    # binary targets / scores [..., N] -> fpr, tpr [..., N + 1], one point per recording, and AUC [...].
+    # Within a run of tied scores every point is moved to the end of the run, so the curve (and the
+    # trapezoidal AUC) goes straight across the tie as sklearn's roc_curve / auc do.
+    order = np.argsort(-scores, axis=-1, kind="stable")
+    scores = np.take_along_axis(scores, order, axis=-1)
+    targets = np.take_along_axis(targets, order, axis=-1).astype(np.float64)
+    n = scores.shape[-1]
+    last = np.concatenate([scores[..., 1:] != scores[..., :-1], np.ones(scores.shape[:-1] + (1,), bool)], axis=-1)
+    end = np.minimum.accumulate(np.where(last, np.arange(n), n)[..., ::-1], axis=-1)[..., ::-1]
+    tps = np.take_along_axis(np.cumsum(targets, axis=-1), end, axis=-1)
+    fps = np.take_along_axis(np.cumsum(1 - targets, axis=-1), end, axis=-1)
+    zero = np.zeros(scores.shape[:-1] + (1,))
+    tpr = np.concatenate([zero, _divide(tps, tps[..., -1:])], axis=-1)
+    fpr = np.concatenate([zero, _divide(fps, fps[..., -1:])], axis=-1)
+    auc = np.sum(np.diff(fpr, axis=-1) * (tpr[..., 1:] + tpr[..., :-1]) / 2, axis=-1)
+    return fpr, tpr, auc
+
+def one_vs_rest(y_true, probs):
+    # [..., N], [..., N, C] -> per-class curves [..., C, N + 1] and the micro curve over all N * C pairs
+    C = probs.shape[-1]
+    targets = np.broadcast_to(np.eye(C)[y_true], probs.shape)
+    per_class = roc_curves(np.swapaxes(targets, -1, -2), np.swapaxes(probs, -1, -2))
+    micro = roc_curves(targets.reshape(*targets.shape[:-2], -1), probs.reshape(*probs.shape[:-2], -1))
+    return per_class, micro
+
+def evaluate_all(outputs, y_true):
+    # outputs: name -> [N, C]; everything below is one vectorised call over the stacked array
+    names = list(outputs)
+    probs = np.stack([outputs[name] for name in names])                   # [M, N, C]
+    cm = confusion_matrices(y_true, probs)                                # [M, C, C]
+    per_class, averages = precision_recall_f1(cm)
+    (fpr, tpr, auc), (micro_fpr, micro_tpr, micro_auc) = one_vs_rest(y_true, probs)
+    fold_y, fold_probs = by_fold(y_true[:, None])[..., 0], by_fold(probs)   # [folds, 100], [M, folds, 100, C]
+    fold_cm = confusion_matrices(fold_y, fold_probs)                           # [M, folds, C, C]
+    _, fold_averages = precision_recall_f1(fold_cm)
+    (_, _, fold_auc), _ = one_vs_rest(fold_y, fold_probs)
+    return {"names": names, "confusion": cm, "per_class": per_class, "averages": averages,
+            "auc": auc, "macro_auc": auc.mean(axis=-1), "micro_auc": micro_auc,
+            "fpr": fpr, "tpr": tpr, "micro_fpr": micro_fpr, "micro_tpr": micro_tpr,
+            "fold_confusion": fold_cm, "fold_accuracy": fold_averages["accuracy"],
+            "fold_macro_f1": fold_averages["macro"]["f1"], "fold_macro_auc": fold_auc.mean(axis=-1)}
+
+def write_tables(results, tables="Tables", figures="Figures"):
+    os.makedirs(tables, exist_ok=True)
+    os.makedirs(figures, exist_ok=True)
+    names, averages = results["names"], results["averages"]
+    with open(os.path.join(tables, "metrics_summary.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["model", "accuracy", "macro_precision", "macro_recall", "macro_f1", "weighted_f1",
+                         "macro_auc", "micro_auc", "fold_accuracy_mean", "fold_accuracy_std", "fold_macro_f1_mean",
+                         "fold_macro_f1_std", "fold_macro_auc_mean", "fold_macro_auc_std"])
+        for i, name in enumerate(names):
+            fold_stats = [s for key in ("fold_accuracy", "fold_macro_f1", "fold_macro_auc")
+                          for s in (results[key][i].mean(), results[key][i].std())]
+            writer.writerow([name] + [f"{v:.6f}" for v in (
+                averages["accuracy"][i], averages["macro"]["precision"][i], averages["macro"]["recall"][i],
+                averages["macro"]["f1"][i], averages["weighted"]["f1"][i], results["macro_auc"][i],
+                results["micro_auc"][i], *fold_stats)])
+    with open(os.path.join(tables, "metrics_per_class.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["model", "class", "precision", "recall", "f1", "support", "auc"])
+        per_class = results["per_class"]
+        for i, name in enumerate(names):
+            for c, label in enumerate(CLASSES):
+                writer.writerow([name, label] + [f"{per_class[k][i, c]:.6f}" for k in ("precision", "recall", "f1")]
+                                + [int(per_class["support"][i, c]), f"{results['auc'][i, c]:.6f}"])
+    np.savez_compressed(os.path.join(figures, "roc_curves.npz"), names=np.array(names), classes=np.array(CLASSES),
+                        fpr=results["fpr"], tpr=results["tpr"], auc=results["auc"],
+                        micro_fpr=results["micro_fpr"], micro_tpr=results["micro_tpr"], micro_auc=results["micro_auc"])
+    np.savez_compressed(os.path.join(figures, "confusion_matrices.npz"), names=np.array(names),
+                        classes=np.array(CLASSES), confusion=results["confusion"],
+                        fold_confusion=results["fold_confusion"])
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else "."
+    outputs = load_outputs(root)
+    results = evaluate_all(outputs, load_labels(root))
+    write_tables(results, os.path.join(root, "Tables"), os.path.join(root, "Figures"))
+    print(f"{'model':<48}{'accuracy':>10}{'macro F1':>10}{'macro AUC':>11}{'micro AUC':>11}")
+    for i, name in enumerate(results["names"]):
+        print(f"{name:<48}{results['averages']['accuracy'][i]:>10.4f}{results['averages']['macro']['f1'][i]:>10.4f}"
+              f"{results['macro_auc'][i]:>11.4f}{results['micro_auc'][i]:>11.4f}")
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import numpy as np
+import tensorflow as tf
+from infer import load_checkpoint
+
+# Serving exports of a trained model:
+#   python export.py training_1/cp.ckpt [out_dir] [--int8]
+# writes out_dir/saved_model, out_dir/model.tflite (and model_int8.tflite, model_int8_full.tflite) and prints
+# latency, size and accuracy against the Keras model. The exported graph is built with batch_size=1 and the
+# deterministic attention of build_model(serving=True), so it contains no random ops.
+
+def build_serving_model(checkpoint, d_model=64, num_heads=[64, 32], classes=5, input_shape=(137, 15)):
+    # the sampled training attention has random ops, scatter and gather_nd, so there is no fallback to it
+    try:
+        return load_checkpoint(checkpoint, 1, d_model=d_model, num_heads=num_heads, classes=classes,
+                               input_shape=input_shape, serving=True)
+    except ValueError as e:
+        raise ValueError(f"cannot export {checkpoint}: {e}; add the serving attention of layers.py to it") from e
+
+def export_saved_model(model, path):
+    serve = tf.function(lambda x: {"probabilities": model(x, training=False)},
+                        input_signature=[tf.TensorSpec((1, *model.input_shape[1:]), tf.float32, name="x")])
+    tf.saved_model.save(model, path, signatures={"serving_default": serve})
+    return path
+
+def export_tflite(saved_model_dir, path, quantize=False, calibration=None):
+    # quantize: int8 weights, float activations. calibration: [N, frames, bins] samples to also quantise the
+    # activations to int8; float in / float out, ops without an int8 kernel stay in float. On the Config-Oct-9
+    # checkpoints int8 activations lose most of the accuracy (top-k query selection), int8 weights do not.
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    if quantize or calibration is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if calibration is not None:
+        converter.representative_dataset = lambda: ([x[np.newaxis].astype(np.float32)] for x in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    return path
+
+class TFLiteModel:
+    def __init__(self, path):
+        self.interpreter = tf.lite.Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]["index"]
+        self.output = self.interpreter.get_output_details()[0]["index"]
+
+    def __call__(self, x):
+        self.interpreter.set_tensor(self.input, np.asarray(x, dtype=np.float32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output)
+
+def size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+def benchmark(predict, X, Y, repeats=200):
+    # single-sample latency (median / p99 after a warm-up) and accuracy over X
+    for x in X[:10]:
+        predict(x[np.newaxis])
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        predict(X[i % len(X)][np.newaxis])
+        times.append(time.perf_counter() - start)
+    probs = np.concatenate([np.asarray(predict(x[np.newaxis])) for x in X])
+    return np.median(times) * 1e3, np.percentile(times, 99) * 1e3, float(np.mean(np.argmax(probs, -1) == Y))
+
+if __name__ == "__main__":
+    checkpoint = sys.argv[1]
+    out_dir = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith("--") else "export"
+    os.makedirs(out_dir, exist_ok=True)
+    data = np.load("mfcc.npz")
+    X, Y = data["X"].astype(np.float32), data["Y"]
+    calibration, X_test, Y_test = X[0:200], X[900:1000], Y[900:1000]   # fold1: test on [900:1000]
+
+    model = build_serving_model(checkpoint, input_shape=X.shape[1:])
+    keras_model = load_checkpoint(checkpoint, 1, input_shape=X.shape[1:])
+    saved_model = export_saved_model(model, os.path.join(out_dir, "saved_model"))
+    exports = {"tflite": export_tflite(saved_model, os.path.join(out_dir, "model.tflite"))}
+    if "--int8" in sys.argv:
+        exports["tflite int8"] = export_tflite(saved_model, os.path.join(out_dir, "model_int8.tflite"), True)
+        exports["int8 full"] = export_tflite(saved_model, os.path.join(out_dir, "model_int8_full.tflite"),
+                                             calibration=calibration)
+
+    keras_predict = tf.function(lambda x: keras_model(x, training=False))
+    serve = tf.saved_model.load(saved_model).signatures["serving_default"]
+    rows = [("keras float", keras_predict, None),
+            ("saved_model", lambda x: serve(x=tf.constant(x))["probabilities"], saved_model)]
+    rows += [(name, TFLiteModel(path), path) for name, path in exports.items()]
+
+    print(f"{'model':<14}{'p50 ms':>9}{'p99 ms':>9}{'size MB':>10}{'accuracy':>10}")
+    for name, predict, path in rows:
+        p50, p99, acc = benchmark(predict, X_test, Y_test)
+        mb = (sum(w.nbytes for w in keras_model.get_weights()) if path is None else size(path)) / 2**20
+        print(f"{name:<14}{p50:>9.2f}{p99:>9.2f}{mb:>10.2f}{acc:>10.3f}")
@@ -0,0 +1,111 @@
+import os
+import sys
+import hashlib
+import json
+import functools
+import numpy as np
+import librosa
+from concurrent.futures import ProcessPoolExecutor
+
+CLASSES = ["AS", "MR", "MS", "MVP", "N"]  # same order as labels.csv
+# The framing of mfcc.npz, which the Config-Oct-9 checkpoints were trained on: the 8 kHz recordings loaded at
+# librosa's default 22050 Hz, padded / cut to 70000 samples (3.17 s), MFCC with librosa's default
+# 512-sample hop -> 1 + 70000 // 512 = 137 frames. The Dense layer after GlobalAveragePooling1D
+# (channels_first) is sized by the frame count, so other framings cannot restore those checkpoints.
+SR = 22050
+MAXLEN = 70000
+HOP = 512
+
+def load_wav(path, sr=SR):
+    x = librosa.load(path, sr=sr)[0]
+    return (x - np.mean(x)) / np.std(x)
+
+def list_recordings(data_dir):
+    paths, labels = [], []
+    for label, name in enumerate(CLASSES):
+        folder = os.path.join(data_dir, name)
+        files = sorted(f for f in os.listdir(folder) if f.endswith(".wav"))
+        paths += [os.path.join(folder, f) for f in files]
+        labels += [label] * len(files)
+    return paths, np.array(labels, dtype=int)
+
+def load_recordings(paths, workers=None):
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(load_wav, paths, chunksize=16))
+
+def interleave(labels):
+    # [AS_0, MR_0, MS_0, MVP_0, N_0, AS_1, ...] as in MFCC.ipynb, so that every
+    # block of 100 recordings (one fold in folds.txt) is class balanced.
+    rank = np.zeros(len(labels), dtype=int)
+    for label in np.unique(labels):
+        idx = np.where(labels == label)[0]
+        rank[idx] = np.arange(len(idx))
+    return np.lexsort((labels, rank))
+
+def pad_sequence(x, maxlen=MAXLEN):
+    out = np.zeros((len(x), maxlen), dtype=np.float32)
+    for i, seq in enumerate(x):
+        seq = seq[:maxlen]
+        out[i, :len(seq)] = seq
+    return out
+
+def mfcc(x, sr=SR, n_mfcc=15, hop_length=HOP):
+    # x: [..., T] -> [..., 1 + T // hop_length, n_mfcc]. librosa's 80 dB floor is relative to the maximum of
+    # the whole array, so it is applied per recording here, as MFCC.ipynb does one recording at a time.
+    S = librosa.power_to_db(librosa.feature.melspectrogram(y=x, sr=sr, hop_length=hop_length), top_db=None)
+    S = np.maximum(S, S.max(axis=(-2, -1), keepdims=True) - 80.)
+    return np.swapaxes(librosa.feature.mfcc(S=S, n_mfcc=n_mfcc), -1, -2).astype(np.float32)
+
+def stft(x, n_fft=256, hop_length=None):
+    # 256 samples (0.032s at the 8 kHz of STFT/Untitled.ipynb, 0.012s at SR); [..., T] -> [..., frames, n_fft // 2 + 1]
+    return np.swapaxes(np.abs(librosa.stft(x, n_fft=n_fft, hop_length=hop_length)), -1, -2).astype(np.float32)
+
+def log_spectrogram(x, n_fft=256, hop_length=None):
+    return np.log1p(stft(x, n_fft=n_fft, hop_length=hop_length))
+
+FRONTENDS = {"mfcc": mfcc, "stft": stft, "logspec": log_spectrogram}
+
+def extract(x, frontend="mfcc", batch_size=64, workers=None, **params):
+    # x: [N, T] padded recordings, split into batches that are transformed in parallel
+    fn = functools.partial(FRONTENDS[frontend], **params)
+    batches = [x[i:i+batch_size] for i in range(0, len(x), batch_size)]
+    with ProcessPoolExecutor(workers) as pool:
+        return np.concatenate(list(pool.map(fn, batches)))
+
+def input_shape(X):
+    # what build_model expects for features of shape [N, frames, bins]
+    return tuple(X.shape[1:])
+
+def _cache_key(paths, frontend, maxlen, params):
+    h = hashlib.sha1(json.dumps([frontend, SR, maxlen, sorted(params.items())], default=str).encode())
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{path}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+def build_features(data_dir, frontend="mfcc", maxlen=MAXLEN, cache_dir="feature_cache", workers=None, **params):
+    # X: [N, frames, bins], Y: [N], classes interleaved in file-name order (AS_0, MR_0, ..., N_0, AS_1, ...).
+    # Every block of 100 is class balanced as in mfcc.npz, but MFCC.ipynb also shuffled each class
+    # (tf.random.shuffle) before interleaving, which is not reproduced: rows do not line up with mfcc.npz.
+    paths, labels = list_recordings(data_dir)
+    order = interleave(labels)
+    paths, labels = [paths[i] for i in order], labels[order]
+
+    cache_path = os.path.join(cache_dir, f"{frontend}-{_cache_key(paths, frontend, maxlen, params)}.npz")
+    if os.path.exists(cache_path):
+        data = np.load(cache_path)
+        return data["X"], data["Y"]
+
+    x = pad_sequence(load_recordings(paths, workers=workers), maxlen=maxlen)
+    X = extract(x, frontend=frontend, workers=workers, **params)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(cache_path, X=X, Y=labels)
+    return X, labels
+
+if __name__ == "__main__":
+    frontend = sys.argv[1] if len(sys.argv) > 1 else "mfcc"
+    data_dir = sys.argv[2] if len(sys.argv) > 2 else "raw_data"
+    X, Y = build_features(data_dir, frontend=frontend)
+    out = sys.argv[3] if len(sys.argv) > 3 else f"{frontend}_features.npz"   # never the canonical mfcc.npz
+    print(frontend, "input_shape:", input_shape(X), "->", out)
+    np.savez(out, X=X, Y=Y)
@@ -0,0 +1,180 @@
+import time
+import numpy as np
+from scipy.linalg import cho_solve, solve_triangular
+from scipy.stats import norm
+
+# Batched version of the GaussianProcess in "Gaussian Process/*.ipynb". Kernels take [N, D] and [M, D]
+# and return the [N, M] covariance matrix; the training covariance is factorised once in fit().
+
+def sq_dist(x1, x2, theta=1.):
+    x1, x2 = x1 / theta, x2 / theta
+    d = np.sum(x1**2, axis=-1)[:, np.newaxis] + np.sum(x2**2, axis=-1)[np.newaxis, :] - 2 * x1 @ x2.T
+    return np.maximum(d, 0.)
+
+class RBF:
+    def __init__(self, l=1., sigma=1.):
+        self.l = l
+        self.sigma = sigma
+
+    def __call__(self, x1, x2):
+        return self.sigma**2 * np.exp(-sq_dist(x1, x2, self.l) / 2)
+
+    def diag(self, x):
+        return np.full(len(x), self.sigma**2)
+
+class Matern52:
+    def __init__(self, sigma=1., theta=1.):
+        self.sigma = sigma
+        self.theta = theta
+
+    def __call__(self, x1, x2):
+        r = np.sqrt(5 * sq_dist(x1, x2, self.theta))
+        return self.sigma**2 * (1 + r + r**2 / 3) * np.exp(-r)
+
+    def diag(self, x):
+        return np.full(len(x), self.sigma**2)
+
+def chol_update(L, x):
+    # lower Cholesky factor of L L^T + x x^T in O(n^2)
+    L, x = L.copy(), x.copy()
+    for k in range(len(x)):
+        r = np.hypot(L[k, k], x[k])
+        c, s = r / L[k, k], x[k] / L[k, k]
+        L[k, k] = r
+        L[k+1:, k] = (L[k+1:, k] + s * x[k+1:]) / c
+        x[k+1:] = c * x[k+1:] - s * L[k+1:, k]
+    return L
+
+class GaussianProcess:
+    # max_observations caps the retained data so long searches keep a constant cost per step:
+    # retain="window" drops the oldest observations, retain="best" keeps the highest targets.
+    def __init__(self, input_dim, kernel, mean_function=lambda x: np.zeros(x.shape[0]), noise_var=0, jitter=1e-10,
+                 max_observations=None, retain="window"):
+        if retain not in ("window", "best"):
+            raise ValueError(f"Unknown retain policy: {retain}")
+        self.kernel = kernel
+        self.dim = input_dim
+        self.mean_function = mean_function
+        self.noise_var = noise_var
+        self.jitter = jitter
+        self.max_observations = max_observations
+        self.retain = retain
+        self.mean = None
+        self.L = None       # lower Cholesky factor of K(X, X) + noise
+        self.alpha = None   # (K + noise)^-1 (Y - mean)
+        self.X = None
+        self.Y = None
+
+    def fit(self, X, Y):
+        self.X = np.asarray(X, dtype=float).reshape(-1, self.dim)
+        self.Y = np.asarray(Y, dtype=float).reshape(-1)
+        if self.max_observations is not None and len(self.Y) > self.max_observations:
+            if self.retain == "window":
+                keep = np.arange(len(self.Y))[-self.max_observations:]
+            else:
+                keep = np.sort(np.argsort(self.Y)[-self.max_observations:])
+            self.X, self.Y = self.X[keep], self.Y[keep]
+        self.mean = self.mean_function(self.X)
+        K = self.kernel(self.X, self.X) + np.eye(len(self.X)) * (self.noise_var + self.jitter)
+        self.L = np.linalg.cholesky(K)
+        self.alpha = cho_solve((self.L, True), self.Y - self.mean)
+        return self
+
+    def add_observation(self, x, y):
+        # append one point or a batch [m, D] by extending the Cholesky factor: O(n^2 m) instead of O(n^3)
+        x = np.asarray(x, dtype=float).reshape(-1, self.dim)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        if self.L is None:
+            return self.fit(x, y)
+        n, m = len(self.X), len(x)
+        L21 = solve_triangular(self.L, self.kernel(self.X, x), lower=True).T       # [m, n]
+        K22 = self.kernel(x, x) + np.eye(m) * (self.noise_var + self.jitter)
+        L = np.zeros((n + m, n + m))
+        L[:n, :n] = self.L
+        L[n:, :n] = L21
+        L[n:, n:] = np.linalg.cholesky(K22 - L21 @ L21.T)
+        self.L = L
+        self.X = np.concatenate([self.X, x])
+        self.Y = np.concatenate([self.Y, y])
+        self.mean = np.concatenate([self.mean, self.mean_function(x)])
+        while self.max_observations is not None and len(self.Y) > self.max_observations:
+            self.remove_observation(0 if self.retain == "window" else int(np.argmin(self.Y)), refresh=False)
+        self.alpha = cho_solve((self.L, True), self.Y - self.mean)
+        return self
+
+    def remove_observation(self, k, refresh=True):
+        # drop row/column k of the covariance: rank-one update of the trailing block, O(n^2)
+        L = self.L
+        n = len(L)
+        new = np.zeros((n - 1, n - 1))
+        new[:k, :k] = L[:k, :k]
+        new[k:, :k] = L[k+1:, :k]
+        new[k:, k:] = chol_update(L[k+1:, k+1:], L[k+1:, k])
+        self.L = new
+        self.X = np.delete(self.X, k, axis=0)
+        self.Y = np.delete(self.Y, k)
+        self.mean = np.delete(self.mean, k)
+        if refresh:
+            self.alpha = cho_solve((self.L, True), self.Y - self.mean)
+        return self
+
+    def _diag(self, x):
+        if hasattr(self.kernel, "diag"):
+            return self.kernel.diag(x)
+        return np.concatenate([np.diag(self.kernel(x[i:i+1024], x[i:i+1024])) for i in range(0, len(x), 1024)])
+
+    def predict(self, x, full_cov=False):
+        # x: [M, D] -> mean [M], variance [M] (or covariance [M, M])
+        x = np.asarray(x, dtype=float).reshape(-1, self.dim)
+        K_s = self.kernel(x, self.X)                               # [M, N]
+        mu = self.mean_function(x) + K_s @ self.alpha
+        v = solve_triangular(self.L, K_s.T, lower=True)            # [N, M]
+        if full_cov:
+            return mu, self.kernel(x, x) - v.T @ v
+        return mu, np.maximum(self._diag(x) - np.sum(v**2, axis=0), 0.)
+
+    def log_marginal_likelihood(self):
+        r = self.Y - self.mean
+        return -0.5 * r @ self.alpha - np.sum(np.log(np.diag(self.L))) - 0.5 * len(r) * np.log(2 * np.pi)
+
+def expected_improvement(mu, var, mu_max, zeta=0.):
+    sigma = np.sqrt(var)
+    improvement = mu - mu_max - zeta
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(sigma > 0, improvement / sigma, 0.)
+    return np.where(sigma > 0, improvement * norm.cdf(z) + sigma * norm.pdf(z), np.maximum(improvement, 0.))
+
+class EI_acquisition_fn:
+    def __init__(self, GP, observations=None, zeta=0.):
+        self.GP = GP
+        observations = GP.X if observations is None else observations
+        self.mu_max = float(np.max(GP.predict(observations)[0]))   # one batched call
+        self.zeta = zeta
+
+    def mu(self, x):
+        return self.GP.predict(x)[0]
+
+    def sigma(self, x):
+        return np.sqrt(self.GP.predict(x)[1])
+
+    def evaluate(self, x):
+        mu, var = self.GP.predict(x)
+        return expected_improvement(mu, var, self.mu_max, self.zeta)
+
+if __name__ == "__main__":
+    f = lambda x: np.reshape(np.sin(np.cos(0.6*x**2) + 1.5*x), -1)
+    x_train = np.random.uniform(-3, 3, (50, 1))
+    model = GaussianProcess(1, kernel=Matern52(2, 0.5), noise_var=0.02).fit(x_train, f(x_train))
+    x_test = np.linspace(-3, 3, 10000)[:, np.newaxis]
+    start = time.perf_counter()
+    mean, var = model.predict(x_test)
+    print(f"10k-point predictive grid: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    x_new = np.random.uniform(-3, 3, (200, 1))
+    for name, step in (("fit", lambda x: model.fit(np.concatenate([model.X, x]), np.concatenate([model.Y, f(x)]))),
+                       ("add_observation", lambda x: model.add_observation(x, f(x)))):
+        model = GaussianProcess(1, kernel=Matern52(2, 0.5), noise_var=0.02).fit(x_train, f(x_train))
+        start = time.perf_counter()
+        for x in x_new:
+            step(x[np.newaxis])
+        print(f"{name}: {(time.perf_counter() - start) / len(x_new) * 1e3:.2f} ms per new observation")
@@ -0,0 +1,140 @@
+import tensorflow as tf
+from tensorflow import keras
+import numpy as np
+from training import build_model, CustomSchedule
+from pretrain_cache import get_state, set_state
+
+# Trials run by sweep.py, ported from grid_search_lr_warmup*.py and grid_search_pretrain_eps*.py
+
+class Model(keras.Model):
+    def __init__(self, model, x_shape, eps=8.0, alph=1.0):
+        super().__init__()
+        self.model = model
+        self.x_shape = x_shape
+        self.x_rank = len(self.x_shape)
+        self.batch_size = x_shape[0]
+
+        self.x_norm_resize_shape = [self.batch_size] + list(tf.ones(self.x_rank, dtype=tf.int32).numpy())[1:]
+
+        self.xi = 1e-6
+        self.eps = eps     # the perturbation parameter
+        self.alph = alph   # regularization coefficient
+        self.lds = lambda y, y_p: tf.math.reduce_sum(keras.losses.kl_divergence(y, y_p))
+
+    def train_step(self, data):
+        x, y = data
+
+        x_p = tf.random.normal(self.x_shape)
+        x_norm = x_p
+        for i in range(self.x_rank-1, 0, -1):
+            x_norm = tf.norm(x_norm, ord=2, axis=int(i))
+        x_p /= tf.reshape(x_norm, self.x_norm_resize_shape)
+        x_p *= self.xi
+
+        with tf.GradientTape() as adversarial_tape:
+            adversarial_tape.watch(x_p)
+            y_p = self.model(x + x_p, training=True)
+            y_hat = self.model(x, training=True)
+            l = self.lds(y_hat, y_p)                     # Calculate the local smoothness measure
+        g = adversarial_tape.gradient(l, x_p)
+
+        g_norm = g
+        for i in range(self.x_rank-1, 0, -1):
+            g_norm = tf.norm(g_norm, ord=2, axis=int(i))
+
+        x_p = self.eps * g / tf.reshape(g_norm, self.x_norm_resize_shape)  # set x_p to be eps * normalized_grad
+
+        with tf.GradientTape() as model_tape:
+            y_p = self.model(x + x_p, training=True)
+            y_hat = self.model(x, training=True)
+            l = self.lds(y_hat, y_p)    # Recalculate regularization
+
+            logits = self.model(x, training=True)
+            loss = self.compiled_loss(y, logits) + self.alph * l / self.batch_size
+
+        self.optimizer.minimize(loss, self.trainable_variables, tape=model_tape)
+        return self.compute_metrics(x, y, logits, None)
+
+    def call(self, x):
+        return self.model(x)
+
+def build_optimizer(lr, warmup):
+    learning_rate = CustomSchedule(lr, warmup_steps=warmup)
+    return keras.optimizers.Adam(learning_rate=learning_rate, beta_1=0.9, beta_2=0.98, epsilon=1e-9)
+
+def summarize(model, x_train, y_train, x_test, y_test):
+    loss = keras.losses.SparseCategoricalCrossentropy(from_logits=False)
+    m = keras.metrics.Accuracy()
+    logs = {}
+    for name, x, y in (("training", x_train, y_train), ("testing", x_test, y_test)):
+        y_hat = model(x)
+        logs[f"{name}_loss"] = float(loss(y, y_hat))
+        m.update_state(y, tf.math.argmax(y_hat, axis=1))
+        logs[f"{name}_acc"] = float(m.result().numpy())
+        m.reset_states()
+    return logs
+
+def eval_lr_warmup(data, d_model, num_heads, batch_size, epochs, lrc, warmup, early_stopping_start,
+                   classes=5, callbacks=()):
+    x_train, y_train, x_test, y_test = data
+    model = build_model(d_model=d_model, num_heads=num_heads, classes=classes, input_shape=x_train.shape[1:],
+                        batch_size=batch_size)
+    model.compile(optimizer=build_optimizer(lrc, warmup),
+                  loss=keras.losses.SparseCategoricalCrossentropy(from_logits=False), metrics=['accuracy'])
+
+    earlystop_callback = keras.callbacks.EarlyStopping(monitor="val_accuracy",
+                                                       patience=300,
+                                                       verbose=1,
+                                                       restore_best_weights=True,
+                                                       start_from_epoch=early_stopping_start)
+    model.fit(x=x_train, y=y_train, batch_size=batch_size, epochs=epochs, validation_data=(x_test, y_test),
+              callbacks=[earlystop_callback, *callbacks])
+    return summarize(model, x_train, y_train, x_test, y_test)
+
+def eval_pretrain_eps(data, d_model, num_heads, batch_size, epochs, lr, warmup, pretraining_epochs, eps,
+                      alpha=1.0, classes=5, callbacks=(), pretrain_cache=None):
+    x_train, y_train, x_val, y_val = data
+    input_shape = x_train.shape[1:]
+    model = build_model(d_model=d_model, num_heads=num_heads, classes=classes, input_shape=input_shape,
+                        batch_size=batch_size)
+    model.compile(optimizer=build_optimizer(lr, warmup),
+                  loss=keras.losses.SparseCategoricalCrossentropy(from_logits=False), metrics=['accuracy'])
+    # pretraining, shared by every eps / alpha through pretrain_cache:
+    state, key = None, None
+    if pretrain_cache is not None:
+        key = pretrain_cache.key(("fit", d_model, num_heads, classes, tuple(input_shape), batch_size, lr, warmup,
+                                  pretraining_epochs), x_train, y_train)
+        state = pretrain_cache.load(key)
+    if state is not None:
+        set_state(model, state)
+    else:
+        model.fit(x=x_train, y=y_train, batch_size=batch_size, epochs=pretraining_epochs,
+                  validation_data=(x_val, y_val))
+        if key is not None:
+            pretrain_cache.store(key, get_state(model))
+    weights = model.get_weights()   # kept in memory, parallel trials would overwrite a shared file
+
+    # rebuild model for vat:
+    model = build_model(d_model=d_model, num_heads=num_heads, classes=classes, input_shape=input_shape,
+                        batch_size=batch_size)
+    model.set_weights(weights)
+    model = Model(model, x_shape=(batch_size, *input_shape), eps=eps, alph=alpha)
+
+    # VAT
+    earlystop_callback = keras.callbacks.EarlyStopping(monitor="val_accuracy",
+                                                       patience=500,
+                                                       verbose=1,
+                                                       restore_best_weights=True,
+                                                       start_from_epoch=450)
+    model.compile(optimizer=build_optimizer(lr, warmup),
+                  loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=False), metrics=["accuracy"])
+    model.fit(x=x_train, y=y_train, batch_size=batch_size, epochs=epochs, validation_data=(x_val, y_val),
+              callbacks=[earlystop_callback, *callbacks])
+    return summarize(model, x_train, y_train, x_val, y_val)
+
+TRIALS = {"lr_warmup": eval_lr_warmup, "pretrain_eps": eval_pretrain_eps}
+
+def load_data(path, train, val):
+    data = np.load(path)
+    X, Y = data["X"], data["Y"]
+    return X[train[0]:train[1]], Y[train[0]:train[1]], X[val[0]:val[1]], Y[val[0]:val[1]]
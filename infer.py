@@ -0,0 +1,176 @@
+import os
+import csv
+import time
+import argparse
+import importlib.util
+import numpy as np
+import tensorflow as tf
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from features import CLASSES, MAXLEN, HOP, load_recordings, pad_sequence, extract, mfcc
+from segmentation import aggregate
+from training import build_model
+import layers as default_layers
+
+# Classify every .wav under a directory with a trained model:
+#   python infer.py training_1/cp.ckpt recordings/ --out predictions.csv --batch-size 64
+# Recordings are processed in chunks; features for the next chunk are extracted (in a process pool)
+# while the model runs on the current one. With --hop, recordings are not truncated to MAXLEN: the
+# MFCC of the whole recording is computed once and cut into model-sized windows every hop samples.
+
+def list_wavs(wav_dir):
+    paths = []
+    for root, _, files in os.walk(wav_dir):
+        paths += [os.path.join(root, f) for f in files if f.lower().endswith(".wav")]
+    return sorted(paths)
+
+_LAYERS = {}
+
+def load_layers(checkpoint, layers_dir=None):
+    # the layers.py a checkpoint was trained with: the one in layers_dir, else the nearest one in a directory
+    # above the checkpoint (Config-Oct-9/VAT/training_1/cp.ckpt -> Config-Oct-9/layers.py). None: training's own.
+    if layers_dir is None:
+        layers_dir = os.path.dirname(os.path.abspath(checkpoint))
+        while not os.path.exists(os.path.join(layers_dir, "layers.py")) and os.path.dirname(layers_dir) != layers_dir:
+            layers_dir = os.path.dirname(layers_dir)
+    path = os.path.realpath(os.path.join(layers_dir, "layers.py"))
+    if not os.path.exists(path) or path == os.path.realpath(default_layers.__file__):
+        return None
+    if path not in _LAYERS:
+        spec = importlib.util.spec_from_file_location(f"layers_{len(_LAYERS)}", path)
+        _LAYERS[path] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_LAYERS[path])
+    return _LAYERS[path]
+
+def load_checkpoint(path, batch_size, d_model=64, num_heads=[64, 32], classes=5, input_shape=(137, 15), serving=False,
+                    layers_dir=None):
+    # pretrained_weights is saved from the Keras model itself, training_1/cp.ckpt from the VAT wrapper
+    # that holds it as .model (plus its optimizer). The model is built from the checkpoint's layers.py.
+    model = build_model(d_model=d_model, num_heads=num_heads, classes=classes, input_shape=input_shape,
+                        batch_size=batch_size, serving=serving, layers=load_layers(path, layers_dir))
+    try:
+        model.load_weights(path).expect_partial().assert_existing_objects_matched()   # optimizer slots are unused
+    except AssertionError:
+        # read(), not restore(): the Checkpoint's own save_counter is not in a Keras-saved file
+        tf.train.Checkpoint(model=model).read(path).expect_partial().assert_existing_objects_matched()
+    return model
+
+def featurize(paths, workers=None, frontend="mfcc"):
+    start = time.perf_counter()
+    X = extract(pad_sequence(load_recordings(paths, workers=workers), maxlen=MAXLEN), frontend=frontend,
+                workers=workers)
+    return X, time.perf_counter() - start
+
+def frame_windows(frames, window, hop):
+    # [T, bins] frames of one recording -> [n, window, bins] views, the last window ends on the last frame
+    if len(frames) < window:
+        frames = np.pad(frames, ((0, window - len(frames)), (0, 0)))
+    starts = np.arange(0, len(frames) - window + 1, hop)
+    if starts[-1] != len(frames) - window:
+        starts = np.append(starts, len(frames) - window)
+    return np.swapaxes(np.lib.stride_tricks.sliding_window_view(frames, window, axis=0)[starts], -1, -2)
+
+def window_frames(window=MAXLEN, hop=MAXLEN // 4):
+    # window / hop in samples -> MFCC frames of features.mfcc: a MAXLEN window is the training input
+    # (1 + MAXLEN // HOP = 137 frames), the hop is rounded down to whole frames
+    return 1 + window // HOP, max(hop // HOP, 1)
+
+def featurize_long(paths, workers=None, window=MAXLEN, hop=MAXLEN // 4):
+    # frames overlap between windows, so MFCC runs once per recording and windows are slices of it
+    # (away from the recording edges identical to the MFCC of the window's samples)
+    start = time.perf_counter()
+    # recordings shorter than a window are padded with silence first, as pad_sequence does for training
+    recordings = [np.pad(x, (0, max(window - len(x), 0))) for x in load_recordings(paths, workers=workers)]
+    window, hop = window_frames(window, hop)
+    with ProcessPoolExecutor(workers) as pool:
+        frames = list(pool.map(mfcc, recordings))
+    windows = [frame_windows(f, window, hop) for f in frames]
+    recording = np.concatenate([np.full(len(w), i) for i, w in enumerate(windows)])
+    return (np.concatenate(windows), recording), time.perf_counter() - start
+
+def predict_long(model, X, recording, batch_size, method="mean"):
+    # windows of all recordings go through the model together -> recording probabilities, confidence
+    # (aggregated probability of the predicted class) and the fraction of windows that agree with it
+    window_probs = predict(model, X, batch_size)
+    _, probs = aggregate(window_probs, recording, method)
+    prediction = np.argmax(probs, axis=-1)
+    votes = np.argmax(window_probs, axis=-1) == prediction[recording]
+    agreement = np.bincount(recording, weights=votes) / np.bincount(recording)
+    return probs, probs[np.arange(len(probs)), prediction], agreement, np.bincount(recording)
+
+def predict(model, X, batch_size):
+    # the model is built for a fixed batch size (ProbSparseAttention), the last batch is zero padded
+    if not hasattr(model, "predict_step_fn"):   # traced once per model, not per chunk
+        model.predict_step_fn = tf.function(lambda x: model(x, training=False))
+    predict_step = model.predict_step_fn
+    out = []
+    for i in range(0, len(X), batch_size):
+        x = X[i:i+batch_size]
+        n = len(x)
+        if n < batch_size:
+            x = np.concatenate([x, np.zeros((batch_size - n, *x.shape[1:]), dtype=x.dtype)])
+        out.append(predict_step(tf.constant(x, tf.float32)).numpy()[:n])
+    return np.concatenate(out)
+
+def run(checkpoint, wav_dir, out_path, batch_size=32, chunk=1024, workers=None, hop=None, window=MAXLEN,
+        method="mean", **model_params):
+    # hop: long-recording mode, windows of `window` samples every `hop` samples aggregated with `method`
+    paths = list_wavs(wav_dir)
+    chunks = [paths[i:i+chunk] for i in range(0, len(paths), chunk)]
+    if hop is not None:
+        featurize_fn = lambda paths, workers: featurize_long(paths, workers, window, hop)
+    else:
+        featurize_fn = featurize
+    model = None
+    feature_time, feature_wait, model_time = 0., 0., 0.
+    start = time.perf_counter()
+    with open(out_path, "w", newline="") as f, ThreadPoolExecutor(1) as prefetch:
+        writer = csv.writer(f)
+        writer.writerow(["path", "prediction"] + CLASSES + (["confidence", "agreement", "windows"] if hop else []))
+        future = prefetch.submit(featurize_fn, chunks[0], workers) if chunks else None
+        for k in range(len(chunks)):
+            t = time.perf_counter()
+            X, elapsed = future.result()
+            feature_wait += time.perf_counter() - t   # the part not hidden behind the model
+            feature_time += elapsed
+            if k + 1 < len(chunks):
+                future = prefetch.submit(featurize_fn, chunks[k + 1], workers)
+            if hop is not None:
+                X, recording = X
+            if model is None:
+                model = load_checkpoint(checkpoint, batch_size, input_shape=X.shape[1:], **model_params)
+            t = time.perf_counter()
+            if hop is not None:
+                probs, *extra = predict_long(model, X, recording, batch_size, method)
+                extra = [[f"{c:.6f}", f"{a:.3f}", int(n)] for c, a, n in zip(*extra)]
+            else:
+                probs = predict(model, X, batch_size)
+                extra = [[]] * len(probs)
+            model_time += time.perf_counter() - t
+            for path, p, e in zip(chunks[k], probs, extra):
+                writer.writerow([os.path.relpath(path, wav_dir), CLASSES[int(np.argmax(p))]] + [f"{v:.6f}" for v in p] + e)
+    total = time.perf_counter() - start
+    stats = {"recordings": len(paths), "seconds": total, "recordings_per_sec": len(paths) / total if total else 0.,
+             "feature_seconds": feature_time, "feature_wait_seconds": feature_wait, "model_seconds": model_time}
+    print(f"{len(paths)} recordings in {total:.1f}s ({stats['recordings_per_sec']:.1f}/s): "
+          f"features {feature_time:.1f}s ({feature_wait:.1f}s not overlapped), model {model_time:.1f}s")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("checkpoint", help="pretrained_weights or training_1/cp.ckpt")
+    parser.add_argument("wav_dir")
+    parser.add_argument("--out", default="predictions.csv")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--chunk", type=int, default=1024, help="recordings featurised at a time")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--d-model", type=int, default=64)
+    parser.add_argument("--num-heads", default="64,32")
+    parser.add_argument("--hop", type=int, default=None, help="classify whole recordings, window every HOP samples")
+    parser.add_argument("--window", type=int, default=MAXLEN, help="samples per window, the model's input length")
+    parser.add_argument("--aggregate", default="mean", choices=["mean", "log", "vote"])
+    parser.add_argument("--layers", default=None, help="directory of the layers.py the checkpoint was trained with "
+                                                       "(default: the nearest one above the checkpoint)")
+    args = parser.parse_args()
+    run(args.checkpoint, args.wav_dir, args.out, batch_size=args.batch_size, chunk=args.chunk, workers=args.workers,
+        hop=args.hop, window=args.window, method=args.aggregate,
+        d_model=args.d_model, num_heads=[int(h) for h in args.num_heads.split(",")], layers_dir=args.layers)
@@ -0,0 +1,64 @@
+import sys
+import json
+import time
+import asyncio
+import numpy as np
+
+# Load generator for serve.py:
+#   python loadgen.py [port] [clients] [requests_per_client] [mfcc|audio]
+# Each client keeps one connection open and sends requests back to back, using recordings from
+# mfcc.npz (or noise when it is missing). Prints throughput, client-side latency and the server metrics.
+
+async def request(reader, writer, method, path, payload=None):
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        key, value = line.decode().split(":", 1)
+        if key.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def client(port, payloads, latencies, errors):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for payload in payloads:
+        start = time.perf_counter()
+        status, _ = await request(reader, writer, "POST", "/predict", payload)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+    writer.close()
+
+async def main(port=8080, clients=64, requests_per_client=50, kind="mfcc"):
+    try:
+        X = np.load("mfcc.npz")["X"][:200].astype(np.float32)
+    except FileNotFoundError:
+        X = np.random.randn(200, 137, 15).astype(np.float32)
+    if kind == "audio":
+        samples = [{"audio": np.random.randn(20000).round(4).tolist(), "sr": 8000} for _ in range(8)]   # as raw_data
+    else:
+        samples = [{"mfcc": x.round(4).tolist()} for x in X]
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, [samples[(c + i) % len(samples)] for i in range(requests_per_client)],
+                                  latencies, errors) for c in range(clients)))
+    wall = time.perf_counter() - start
+    latencies = np.array(latencies) * 1e3
+    print(f"{len(latencies)} requests from {clients} clients in {wall:.1f}s: {len(latencies) / wall:.1f} req/s, "
+          f"p50 {np.percentile(latencies, 50):.1f}ms, p99 {np.percentile(latencies, 99):.1f}ms, {len(errors)} errors")
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    print(json.dumps((await request(reader, writer, "GET", "/metrics"))[1], indent=1))
+    writer.close()
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    n = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    kind = sys.argv[4] if len(sys.argv) > 4 else "mfcc"
+    asyncio.run(main(port, clients, n, kind))
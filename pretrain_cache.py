@@ -0,0 +1,89 @@
+import os
+import json
+import uuid
+import hashlib
+import numpy as np
+
+# Pretrained states shared across trials. Trials that only differ in the VAT eps / alpha run the same
+# plain pretraining first; the model weights (and optimizer slots, so the warmup schedule carries on
+# from the same step) after pretraining are stored under a key of everything that influences them
+# plus a hash of the training data. Least recently used entries are evicted above max_bytes.
+
+def data_hash(*arrays):
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(np.asarray(a))
+        h.update(str((a.dtype, a.shape)).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def optimizer_variables(optimizer):
+    variables = optimizer.variables
+    return variables() if callable(variables) else variables   # method on the legacy optimizers
+
+def get_state(model, optimizer=None):
+    state = {f"w{i}": w for i, w in enumerate(model.get_weights())}
+    if optimizer is not None:
+        state.update({f"o{i}": v.numpy() for i, v in enumerate(optimizer_variables(optimizer))})
+    return state
+
+def set_state(model, state, optimizer=None):
+    model.set_weights([state[f"w{i}"] for i in range(len(model.get_weights()))])
+    if optimizer is not None and "o0" in state:
+        optimizer.build(model.trainable_variables)   # slots are created lazily on the first step otherwise
+        for i, v in enumerate(optimizer_variables(optimizer)):
+            v.assign(state[f"o{i}"])
+
+class PretrainCache:
+    def __init__(self, cache_dir="pretrain_cache", max_bytes=2 * 2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, params, *data):
+        # params: whatever determines the pretrained state, e.g. (d_model, num_heads, lr, warmup_steps,
+        # pretrain_steps, ...); data: the training arrays, so each fold gets its own entry
+        params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha1((params + data_hash(*data)).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                state = dict(data)
+        except (FileNotFoundError, OSError, ValueError):   # missing, or evicted / half-written by another worker
+            self.misses += 1
+            return None
+        os.utime(path)   # recently used
+        self.hits += 1
+        return state
+
+    def store(self, key, state):
+        tmp = os.path.join(self.cache_dir, f".{uuid.uuid4().hex}.npz")
+        np.savez(tmp, **state)
+        os.replace(tmp, self._path(key))   # atomic, parallel trials may store the same key
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz") and not name.startswith("."):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,116 @@
+import sys
+import time
+import functools
+import numpy as np
+import tensorflow as tf
+from training import TrainingEngine, build_model, loss_fn
+from infer import load_checkpoint, load_layers, predict
+
+# Attention head pruning for a trained checkpoint:
+#   python pruning.py training_1/cp.ckpt [--finetune EPOCHS]
+# MultiHeadSelfAttention splits heads with a reshape, not a transpose, so a head covers a block of
+# (position, channel) pairs and the projections do not depend on the head count: pruning drops heads
+# from the attention computation (build_model(keep_heads=...)) and every weight transfers unchanged.
+# Importance and accuracy use the deterministic serving attention, so the table is reproducible.
+# Every model is built from the checkpoint's own layers.py (infer.load_layers), which needs keep_heads.
+
+LEVELS = (1., 0.75, 0.5, 0.25)   # fraction of heads kept in every block
+
+def attention_layers(model):
+    # by class name: a checkpoint's layers.py defines its own MultiHeadSelfAttention class
+    layers = [layer for layer in model.layers if type(layer).__name__ == "MultiHeadSelfAttention"]
+    if not layers or not all(hasattr(layer.attention, "keep_heads") for layer in layers):
+        raise ValueError(f"{model.name} has no attention layers with keep_heads to prune")
+    return layers
+
+def head_importance(model, X_val, Y_val, batch_size):
+    # leave-one-out: the increase of the validation loss when a single head is pruned, per block
+    # keep_heads is read when the step is traced, so the pruned head is an argument: one trace per head.
+    # Eager calls would re-read it too, but grow the process memory by tens of MB per call.
+    step = tf.function(lambda x, pruned: model(x, training=False))
+    def val_loss(pruned=None):
+        probs = []
+        for i in range(0, len(X_val), batch_size):
+            x = X_val[i:i+batch_size]
+            n = len(x)
+            x = np.concatenate([x, np.zeros((batch_size - n, *x.shape[1:]), dtype=x.dtype)])
+            probs.append(step(tf.constant(x, tf.float32), pruned).numpy()[:n])
+        return float(loss_fn(Y_val, np.concatenate(probs)))
+    base = val_loss()
+    scores = []
+    for block, layer in enumerate(attention_layers(model)):
+        attention = layer.attention
+        heads = np.arange(layer.num_heads)
+        layer_scores = []
+        for h in heads:
+            attention.keep_heads = np.delete(heads, h).astype(np.int32)
+            layer_scores.append(val_loss((block, int(h))) - base)
+        attention.keep_heads = None
+        scores.append(np.array(layer_scores))
+    return scores
+
+def keep_heads(scores, fraction):
+    # the most important heads of each block, at least one
+    return [np.sort(np.argsort(-s)[:max(int(round(len(s) * fraction)), 1)]).tolist() for s in scores]
+
+def latency(model, repeats=100):
+    x = tf.zeros((1, *model.input_shape[1:]))
+    step = tf.function(lambda x: model(x, training=False))
+    step(x)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        step(x).numpy()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1e3
+
+def accuracy(model, X, Y, batch_size):
+    return float(np.mean(np.argmax(predict(model, X, batch_size), -1) == Y))
+
+def prune(checkpoint, X_train, Y_train, X_val, Y_val, X_test, Y_test, d_model=64, num_heads=[64, 32],
+          batch_size=32, levels=LEVELS, finetune_epochs=0, lr=0.115, warmup_steps=6000, eps=35., alpha=1.,
+          layers_dir=None):
+    input_shape = tuple(X_train.shape[1:])
+    params = dict(d_model=d_model, num_heads=num_heads, input_shape=input_shape)
+    # raises ValueError for a layers.py without serving / keep_heads, before any scoring
+    model = load_checkpoint(checkpoint, batch_size, serving=True, layers_dir=layers_dir, **params)
+    layers = load_layers(checkpoint, layers_dir)
+    weights = model.get_weights()
+    scores = head_importance(model, X_val, Y_val, batch_size)
+    for i, s in enumerate(scores):
+        print(f"block {i}: most important heads {np.argsort(-s)[:8].tolist()}, "
+              f"{int(np.sum(s <= 0))}/{len(s)} heads do not raise the validation loss when removed")
+
+    rows = []
+    for fraction in levels:
+        keep = None if fraction == 1. else keep_heads(scores, fraction)
+        pruned = build_model(batch_size=batch_size, serving=True, keep_heads=keep, layers=layers, **params)
+        pruned.set_weights(weights)
+        row = [fraction, [len(k) for k in keep] if keep else list(num_heads), accuracy(pruned, X_test, Y_test, batch_size)]
+        if finetune_epochs:
+            # short VAT fine-tuning from the pruned weights on the training pipeline, then the same test
+            engine = TrainingEngine(batch_size=batch_size, **params,
+                                    build_fn=functools.partial(build_model, keep_heads=keep, layers=layers))
+            X_eval, Y_eval = np.concatenate([X_val, X_test]), np.concatenate([Y_val, Y_test])
+            engine.evaluate(X_train, Y_train, X_eval, Y_eval, finetune_epochs, lr, warmup_steps, 0, eps, alpha,
+                            init_weights=weights)
+            pruned.set_weights(engine.model.get_weights())
+            row.append(accuracy(pruned, X_test, Y_test, batch_size))
+        single = build_model(batch_size=1, serving=True, keep_heads=keep, layers=layers, **params)
+        single.set_weights(weights)
+        row.append(latency(single))
+        rows.append(row)
+
+    print(f"{'kept':>6}  {'heads':<12}{'accuracy':>10}" + (f"{'fine-tuned':>12}" if finetune_epochs else "") + f"{'ms/sample':>11}")
+    for row in rows:
+        fraction, heads, acc, *rest = row
+        print(f"{fraction:>6.0%}  {str(heads):<12}{acc:>10.3f}" + "".join(f"{v:>12.3f}" for v in rest[:-1]) + f"{rest[-1]:>11.2f}")
+    return scores, rows
+
+if __name__ == "__main__":
+    checkpoint = sys.argv[1]
+    finetune = int(sys.argv[sys.argv.index("--finetune") + 1]) if "--finetune" in sys.argv else 0
+    data = np.load("mfcc.npz")
+    X, Y = data["X"].astype(np.float32), data["Y"]
+    # fold1: train on [0:900], validate on [900:950], test on [950:1000] as in training.evaluate
+    prune(checkpoint, X[0:900], Y[0:900], X[900:950], Y[900:950], X[950:1000], Y[950:1000], finetune_epochs=finetune)
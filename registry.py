@@ -0,0 +1,246 @@
+import os
+import re
+import sys
+import csv
+import glob
+import json
+import time
+import hashlib
+import sqlite3
+import numpy as np
+
+# Run registry: one row per trained model (config + fold), its per-epoch metrics and the files it
+# wrote. Queries like "best test accuracy per config across folds" become one indexed SELECT instead
+# of loading every log*.npy / Bayessian_logs*.json / fold*.npy in the tree.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, name TEXT, source TEXT, config_hash TEXT, params TEXT,
+                                 fold INTEGER, status TEXT, test_acc REAL, started REAL, finished REAL);
+CREATE TABLE IF NOT EXISTS epochs (run INTEGER, epoch INTEGER, metric TEXT, value REAL,
+                                   PRIMARY KEY (run, metric, epoch));
+CREATE TABLE IF NOT EXISTS artifacts (run INTEGER, kind TEXT, path TEXT);
+CREATE TABLE IF NOT EXISTS imported (path TEXT PRIMARY KEY, mtime REAL);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (config_hash, fold);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name, test_acc);
+CREATE INDEX IF NOT EXISTS artifacts_run ON artifacts (run, kind);
+CREATE INDEX IF NOT EXISTS artifacts_path ON artifacts (path);
+"""
+
+def config_hash(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def hyperparameter_dict(hyperparameters):
+    # the tuple passed to training.evaluate -> named config
+    keys = ("d_model", "num_heads", "classes", "input_shape", "batch_size", "epochs", "lr", "warmup_steps",
+            "pretrain_steps", "eps", "alpha")
+    return {k: list(v) if isinstance(v, tuple) else v for k, v in zip(keys, hyperparameters)}
+
+class Registry:
+    def __init__(self, path="runs.db"):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")   # BO / sweep workers write concurrently
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def start_run(self, params, name="", fold=None, source="", started=None):
+        with self._connect() as conn:
+            cur = conn.execute("INSERT INTO runs (name, source, config_hash, params, fold, status, started) "
+                               "VALUES (?, ?, ?, ?, ?, 'running', ?)",
+                               (name, source, config_hash(params), json.dumps(params, default=str), fold,
+                                time.time() if started is None else started))
+            return Run(self, cur.lastrowid)
+
+    def add_run(self, params, test_acc, name="", fold=None, source="", history=None, artifacts=(), started=None):
+        # a finished run in one call, used by the importer
+        run = self.start_run(params, name, fold, source, started)
+        if history:
+            run.log_history(history)
+        for kind, path in artifacts:
+            run.log_artifact(kind, path)
+        run.finish(test_acc)
+        return run
+
+    def query(self, sql, args=()):
+        with self._connect() as conn:
+            return conn.execute(sql, args).fetchall()
+
+    def best_per_config(self, name=None):
+        # -> [(config_hash, params, folds, mean test acc, best test acc)], best mean first
+        sql = ("SELECT config_hash, params, COUNT(DISTINCT fold), AVG(test_acc), MAX(test_acc) FROM "
+               "(SELECT config_hash, params, fold, MAX(test_acc) AS test_acc FROM runs "
+               "WHERE status = 'done' AND test_acc IS NOT NULL" + (" AND name = ?" if name is not None else "") +
+               " GROUP BY config_hash, fold) GROUP BY config_hash ORDER BY AVG(test_acc) DESC")
+        return [(h, json.loads(p), n, mean, best) for h, p, n, mean, best in
+                self.query(sql, () if name is None else (name,))]
+
+    def history(self, run, metric):
+        return np.array([v for v, in self.query("SELECT value FROM epochs WHERE run = ? AND metric = ? ORDER BY epoch",
+                                                (run, metric))])
+
+    def is_imported(self, path):
+        row = self.query("SELECT mtime FROM imported WHERE path = ?", (path,))
+        return bool(row) and row[0][0] == os.path.getmtime(path)
+
+    def mark_imported(self, path):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO imported VALUES (?, ?)", (path, os.path.getmtime(path)))
+
+class Run:
+    def __init__(self, registry, id):
+        self.registry = registry
+        self.id = id
+
+    def log_epoch(self, epoch, **metrics):
+        with self.registry._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO epochs VALUES (?, ?, ?, ?)",
+                             [(self.id, epoch, k, float(v)) for k, v in metrics.items()])
+
+    def log_history(self, history):
+        # {metric: [value per epoch]}
+        rows = [(self.id, epoch, k, float(v)) for k, values in history.items()
+                for epoch, v in enumerate(np.ravel(np.asarray(values, dtype=float)))]
+        with self.registry._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO epochs VALUES (?, ?, ?, ?)", rows)
+
+    def log_artifact(self, kind, path):
+        with self.registry._connect() as conn:
+            conn.execute("INSERT INTO artifacts VALUES (?, ?, ?)", (self.id, kind, path))
+
+    def finish(self, test_acc=None, status="done"):
+        with self.registry._connect() as conn:
+            conn.execute("UPDATE runs SET status = ?, test_acc = ?, finished = ? WHERE id = ?",
+                         (status, None if test_acc is None else float(test_acc), time.time(), self.id))
+
+# importer for the artifacts written before the registry existed
+
+def fold_range(fold, n=1000, k=10):
+    # folds.txt: fold1 tests on [900:1000], ..., fold10 on [0:100]
+    size = n // k
+    return n - fold * size, n - (fold - 1) * size
+
+def _fold(path):
+    m = re.search(r"fold_?(\d+)", os.path.basename(path))
+    return None if m is None else int(m.group(1))
+
+def _accuracy(logits, labels):
+    if labels is None or len(logits) != len(labels):
+        return None
+    return float(np.mean(np.argmax(logits, axis=-1) == labels))
+
+def import_training_logs(registry, paths):
+    # log*.npy from training.evaluate(save_logs=True): [dict of per-epoch lists]
+    for path in paths:
+        log = np.load(path, allow_pickle=True)[0]
+        val_loss, test_acc = np.asarray(log["val_loss"], dtype=float), np.asarray(log["test_acc"], dtype=float)
+        acc = test_acc[np.argmin(val_loss)] if len(val_loss) else None
+        registry.add_run({"log": os.path.basename(path)}, acc, name="training", source=path, history=log,
+                         artifacts=[("log", path)], started=os.path.getmtime(path))
+        registry.mark_imported(path)
+
+def import_bo_logs(registry, paths):
+    # JSONLogger files, one line per evaluated point; the fold is in the file name
+    for path in paths:
+        name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                res = json.loads(line)
+                run = registry.add_run(res["params"], res["target"], name=f"{name}/bo", fold=_fold(path), source=path)
+                run.log_artifact("bo_log", path)
+        registry.mark_imported(path)
+
+def import_fold_results(registry, path):
+    # results_acc.txt / result_acc.txt: "1: 0.98 (retrained)" or "fold1: 1.0"; folds.txt next to it
+    # holds the test slice of each fold
+    directory = os.path.dirname(path)
+    ranges = {}
+    folds_path = os.path.join(directory, "folds.txt")
+    if os.path.exists(folds_path):
+        with open(folds_path) as f:
+            for line in f:
+                m = re.match(r"fold(\d+): test: \[(\d+):(\d+)\]", line.strip())
+                if m:
+                    ranges[int(m.group(1))] = [int(m.group(2)), int(m.group(3))]
+    with open(path) as f:
+        for line in f:
+            m = re.match(r"(?:fold)?(\d+):\s*([\d.]+)\s*(.*)", line.strip())
+            if not m:
+                continue
+            fold = int(m.group(1))
+            params = {"experiment": os.path.basename(directory), "test": ranges.get(fold, list(fold_range(fold)))}
+            if m.group(3):
+                params["note"] = m.group(3).strip("() ")
+            registry.add_run(params, float(m.group(2)), name=os.path.basename(directory), fold=fold, source=path,
+                             artifacts=[("results", path)])
+    registry.mark_imported(path)
+
+def import_fold_logits(registry, paths, name, labels=None, params=None):
+    # fold*.npy test-fold outputs [100, classes]; accuracy against mfcc.npz labels when available
+    for path in paths:
+        fold = _fold(path)
+        start, end = fold_range(fold)
+        acc = _accuracy(np.load(path), None if labels is None else labels[start:end])
+        registry.add_run({"model": name, **(params or {})}, acc, name=name, fold=fold, source=path,
+                         artifacts=[("logits", path)])
+        registry.mark_imported(path)
+
+def import_predictions(registry, paths, labels=None):
+    # metrics/<model>/y_pred.npy: outputs for all 1000 recordings, stacked over the 10 test folds
+    for path in paths:
+        name = os.path.basename(os.path.dirname(path))
+        registry.add_run({"model": name}, _accuracy(np.load(path), labels), name=f"metrics/{name}", source=path,
+                         artifacts=[("y_pred", path)])
+        registry.mark_imported(path)
+
+def import_grid_search(registry, paths):
+    # history*.npy written by the grid searches / sweep.export_history: [{param: value, "logs": {...}}]
+    for path in paths:
+        for entry in np.load(path, allow_pickle=True):
+            entry = dict(entry)
+            logs = entry.pop("logs", None)
+            logs = getattr(logs, "history", logs)   # keras History objects in the old files
+            logs = logs if isinstance(logs, dict) else {}
+            acc = logs.get("testing_acc", logs.get("val_accuracy"))
+            if np.ndim(acc) == 1:
+                acc = max(acc)
+            registry.add_run(entry, acc, name="grid_search", source=path, artifacts=[("history", path)],
+                             history={k: v for k, v in logs.items() if np.ndim(v) == 1})
+        registry.mark_imported(path)
+
+def import_existing(registry, root=".", labels_path="mfcc.npz"):
+    labels = np.load(os.path.join(root, labels_path))["Y"] if os.path.exists(os.path.join(root, labels_path)) else None
+    new = lambda paths: [p for p in sorted(paths) if not registry.is_imported(p)]
+    import_training_logs(registry, new(glob.glob(os.path.join(root, "**", "log*.npy"), recursive=True)))
+    import_bo_logs(registry, new(glob.glob(os.path.join(root, "**", "Bayessian_logs*.json"), recursive=True)))
+    for path in new(glob.glob(os.path.join(root, "**", "result*_acc.txt"), recursive=True)):
+        import_fold_results(registry, path)
+    import_predictions(registry, new(glob.glob(os.path.join(root, "metrics", "*", "y_pred.npy"))), labels)
+    import_grid_search(registry, new(glob.glob(os.path.join(root, "**", "history*.npy"), recursive=True)))
+
+    ablation = os.path.join(root, "Ablation Study")
+    variants = {}
+    if os.path.exists(os.path.join(ablation, "folder_labels.csv")):
+        with open(os.path.join(ablation, "folder_labels.csv")) as f:
+            variants = {row[0]: row[1] for row in list(csv.reader(f))[1:]}
+    for directory in sorted(glob.glob(os.path.join(ablation, "[0-9]*"))):
+        key = os.path.basename(directory)
+        import_fold_logits(registry, new(glob.glob(os.path.join(directory, "fold*.npy"))), "ablation", labels,
+                           params={"variant": variants.get(key, key)})
+    import_fold_logits(registry, new(glob.glob(os.path.join(root, "InceptionTime", "fold*.npy"))), "InceptionTime",
+                       labels)
+
+if __name__ == "__main__":
+    # python registry.py import [root]  |  python registry.py best [name]
+    registry = Registry("runs.db")
+    if sys.argv[1] == "import":
+        start = time.perf_counter()
+        import_existing(registry, sys.argv[2] if len(sys.argv) > 2 else ".")
+        n, = registry.query("SELECT COUNT(*) FROM runs")[0]
+        print(f"{n} runs in registry ({time.perf_counter() - start:.1f}s)")
+    elif sys.argv[1] == "best":
+        for h, params, folds, mean, best in registry.best_per_config(sys.argv[2] if len(sys.argv) > 2 else None)[:20]:
+            print(f"{h} folds={folds} mean={mean:.4f} best={best:.4f} {params}")
@@ -0,0 +1,112 @@
+import time
+import uuid
+import sqlite3
+import numpy as np
+
+class ASHA:
+    # Asynchronous successive halving. Trials report a validation metric every epoch; at each rung
+    # (grace_period * reduction_factor^k epochs) a trial is stopped unless it is in the top
+    # 1/reduction_factor of everything that has reached the same rung. State lives in a SQLite file
+    # so trials running in different processes are ranked against each other. Rows are keyed by a
+    # search id: a new search (new id, by default) is never ranked against the trials of earlier ones,
+    # while every process holding this object (pickled to BO workers) shares the same id.
+    def __init__(self, path="asha.db", grace_period=100, max_epochs=1000, reduction_factor=3, mode="min",
+                 search=None):
+        if mode not in ("min", "max"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.path = path
+        self.search = search or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.reduction_factor = reduction_factor
+        self.mode = mode
+        self.rungs = []
+        r = grace_period
+        while r < max_epochs:
+            self.rungs.append(r)
+            r *= reduction_factor
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(rungs)")]
+            if columns and "search" not in columns:
+                # files written before rows had a search id only hold stale rungs
+                conn.execute("DROP TABLE rungs")
+                conn.execute("DROP TABLE IF EXISTS trials")
+            conn.execute("CREATE TABLE IF NOT EXISTS rungs (search TEXT, bracket TEXT, rung INTEGER, trial TEXT, "
+                         "value REAL, PRIMARY KEY (search, bracket, rung, trial))")
+            conn.execute("CREATE TABLE IF NOT EXISTS trials (search TEXT, trial TEXT, epochs INTEGER, "
+                         "budget INTEGER, stopped INTEGER, PRIMARY KEY (search, trial))")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def should_stop(self, trial, epochs, value, bracket=""):
+        if not np.isfinite(value):
+            return True     # diverged
+        if epochs not in self.rungs:
+            return False
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO rungs VALUES (?, ?, ?, ?, ?)",
+                         (self.search, bracket, epochs, trial, value))
+            values = [v for v, in conn.execute("SELECT value FROM rungs WHERE search = ? AND bracket = ? AND rung = ?",
+                                               (self.search, bracket, epochs))]
+        if len(values) < self.reduction_factor:
+            return False
+        q = 100 / self.reduction_factor
+        if self.mode == "min":
+            return value > np.percentile(values, q)
+        return value < np.percentile(values, 100 - q)
+
+    def reset(self):
+        # forget the rungs and trials of this search id
+        with self._connect() as conn:
+            conn.execute("DELETE FROM rungs WHERE search = ?", (self.search,))
+            conn.execute("DELETE FROM trials WHERE search = ?", (self.search,))
+
+    def reporter(self, trial, bracket=""):
+        return Reporter(self, trial, bracket)
+
+    def finish(self, trial, epochs, budget, stopped):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?)",
+                         (self.search, trial, epochs, budget, int(stopped)))
+
+    def summary(self, wall=None):
+        with self._connect() as conn:
+            n, stopped, epochs, budget = conn.execute(
+                "SELECT COUNT(*), SUM(stopped), SUM(epochs), SUM(budget) FROM trials WHERE search = ?",
+                (self.search,)).fetchone()
+        if not n:
+            return
+        print(f"search {self.search}: {n} trials, {stopped} stopped early, {epochs}/{budget} epochs trained "
+              f"({epochs / budget:.1%})")
+        if wall is not None:
+            # not measured: assumes every epoch takes the same time with or without stopping
+            print(f"search wall time {wall:.1f}s; without early stopping ~{wall * budget / epochs:.1f}s "
+                  f"(estimate, wall time scaled by budget / epochs trained)")
+
+class Reporter:
+    # per-trial callable handed to training.evaluate(report=...): report(epoch, value) -> stop?
+    def __init__(self, scheduler, trial, bracket=""):
+        self.scheduler = scheduler
+        self.trial = trial
+        self.bracket = bracket
+        self.epochs = 0
+        self.stopped = False
+
+    def __call__(self, epoch, value):
+        self.epochs = epoch + 1
+        self.stopped = self.scheduler.should_stop(self.trial, self.epochs, value, self.bracket)
+        return self.stopped
+
+def keras_callback(scheduler, trial, monitor="val_loss", bracket=""):
+    # same scheduler for the model.fit based grid searches
+    from tensorflow import keras
+    report = scheduler.reporter(trial, bracket)
+
+    class ASHACallback(keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            if report(epoch, float(logs[monitor])):
+                print(f"ASHA: stopping {trial} after {epoch + 1} epochs")
+                self.model.stop_training = True
+
+    callback = ASHACallback()
+    callback.report = report
+    return callback
@@ -0,0 +1,101 @@
+import sys
+import numpy as np
+from scipy import signal, ndimage
+from features import SR, list_recordings, load_recordings, interleave, mfcc
+
+ENV_SR = 200     # sampling rate of the envelope used for S1/S2 picking
+WINDOW = 1.6     # seconds per window, ~2 cardiac cycles at 75 bpm
+
+def pad_batch(x):
+    lengths = np.array([len(seq) for seq in x])
+    out = np.zeros((len(x), lengths.max()), dtype=np.float32)
+    for i, seq in enumerate(x):
+        out[i, :len(seq)] = seq
+    return out, lengths
+
+def shannon_envelope(x, sr=SR, band=(25, 400), smooth=0.02):
+    # x: [B, T] -> [B, T * ENV_SR / sr]
+    sos = signal.butter(4, band, btype="bandpass", fs=sr, output="sos")
+    x = signal.sosfiltfilt(sos, x, axis=-1)
+    x = x / (np.max(np.abs(x), axis=-1, keepdims=True) + 1e-12)
+    e = -x**2 * np.log(x**2 + 1e-12)
+    e = ndimage.uniform_filter1d(e, size=int(smooth * sr), axis=-1)[:, ::sr // ENV_SR]
+    return (e - e.mean(axis=-1, keepdims=True)) / (e.std(axis=-1, keepdims=True) + 1e-12)
+
+def heart_period(env, lengths, min_bpm=40, max_bpm=180):
+    # autocorrelation of the whole batch in one FFT, peak inside the plausible heart-rate range
+    n = env.shape[-1]
+    env = np.where(np.arange(n) < lengths[:, np.newaxis], env, 0.)
+    f = np.fft.rfft(env, 2 * n, axis=-1)
+    ac = np.fft.irfft(f * np.conj(f), axis=-1)[:, :n]
+    lo, hi = int(ENV_SR * 60 / max_bpm), int(ENV_SR * 60 / min_bpm)
+    return lo + np.argmax(ac[:, lo:hi], axis=-1)
+
+def find_s1(env, period):
+    peaks, _ = signal.find_peaks(env, height=0., distance=max(1, int(0.2 * period)))
+    if len(peaks) < 2:
+        return np.arange(0, len(env), period)
+    # systole (S1 -> S2) is shorter than diastole (S2 -> S1)
+    s1 = peaks[:-1][np.diff(peaks) < 0.5 * period]
+    keep = []
+    for p in s1:
+        if not keep or p - keep[-1] > 0.7 * period:
+            keep.append(p)
+    if not keep:
+        return np.arange(peaks[0], len(env), period)
+    return np.array(keep)
+
+def segment(x, window=WINDOW, sr=SR, offset=0.05, max_windows=None):
+    # Cut every recording into windows of `window` seconds starting just before each S1.
+    # Returns windows [N, window * sr] and the index of the recording each window came from.
+    batch, lengths = pad_batch(x)
+    env = shannon_envelope(batch, sr=sr)
+    env_lengths = lengths * ENV_SR // sr
+    periods = heart_period(env, env_lengths)
+    size = int(window * sr)
+    step = sr // ENV_SR
+
+    windows, recording = [], []
+    for i in range(len(x)):
+        starts = find_s1(env[i, :env_lengths[i]], periods[i]) * step - int(offset * sr)
+        starts = np.unique(np.clip(starts, 0, max(lengths[i] - size, 0)))
+        if max_windows is not None:
+            starts = starts[:max_windows]
+        seq = batch[i, :max(lengths[i], size)]
+        if len(seq) < size:
+            seq = np.pad(seq, (0, size - len(seq)))
+        windows.append(np.lib.stride_tricks.sliding_window_view(seq, size)[starts])
+        recording.append(np.full(len(starts), i))
+    return np.concatenate(windows), np.concatenate(recording)
+
+def aggregate(probs, recording, method="mean"):
+    # window probabilities -> recording probabilities
+    ids, inverse = np.unique(recording, return_inverse=True)
+    if method == "vote":
+        probs = np.eye(probs.shape[-1])[np.argmax(probs, axis=-1)]
+    elif method == "log":
+        probs = np.log(probs + 1e-12)
+    elif method != "mean":
+        raise ValueError(f"Unknown aggregation method: {method}")
+    out = np.zeros((len(ids), probs.shape[-1]))
+    np.add.at(out, inverse, probs)
+    out /= np.bincount(inverse)[:, np.newaxis]
+    if method == "log":
+        out = np.exp(out - out.max(axis=-1, keepdims=True))
+        out /= out.sum(axis=-1, keepdims=True)
+    return ids, out
+
+def build_window_dataset(data_dir, window=WINDOW, n_mfcc=15, max_windows=None):
+    paths, labels = list_recordings(data_dir)
+    order = interleave(labels)
+    recordings = load_recordings([paths[i] for i in order])
+    windows, recording = segment(recordings, window=window, max_windows=max_windows)
+    X = mfcc(windows, n_mfcc=n_mfcc)
+    Y = labels[order][recording]
+    return X, Y, recording  # recording index follows the build_features order, split folds on it
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "raw_data"
+    X, Y, R = build_window_dataset(data_dir)
+    print(X.shape, "windows from", len(np.unique(R)), "recordings")
+    np.savez("mfcc_windows.npz", X=X, Y=Y, R=R)
@@ -0,0 +1,172 @@
+import sys
+import json
+import time
+import asyncio
+import collections
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import librosa
+from features import SR, MAXLEN, mfcc, pad_sequence
+
+# Local inference endpoint with dynamic micro-batching:
+#   python serve.py training_1/cp.ckpt [port] [max_batch] [max_wait_ms]
+#   POST /predict  {"mfcc": [[...15 values] x 137 frames]} or {"audio": [samples], "sr": rate (default features.SR)}
+#                  -> {"probabilities": [...], "batch_size": n}
+#   GET  /metrics  queue depth, batch-size histogram, p50 / p99 latency
+# Requests are queued and run together once max_batch are waiting or the oldest has waited max_wait.
+
+class MicroBatcher:
+    def __init__(self, predict, max_batch=32, max_wait=0.005):
+        self.predict = predict            # [max_batch, ...] -> [max_batch, classes], blocking
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(1)   # the model runs off the event loop, one batch at a time
+        self.batch_sizes = collections.Counter()
+        self.latencies = collections.deque(maxlen=10000)
+        self.requests = 0
+
+    async def submit(self, x):
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self.queue.put((x, future))
+        probs, n = await future
+        self.latencies.append(time.perf_counter() - start)
+        self.requests += 1
+        return probs, n
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            x = np.stack([x for x, _ in batch])
+            n = len(batch)
+            if n < self.max_batch:   # the model has a static batch size
+                x = np.concatenate([x, np.zeros((self.max_batch - n, *x.shape[1:]), dtype=x.dtype)])
+            try:
+                probs = await loop.run_in_executor(self.executor, self.predict, x)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batch_sizes[n] += 1
+            for (_, future), p in zip(batch, probs[:n]):
+                if not future.done():
+                    future.set_result((p, n))
+
+    def metrics(self):
+        latencies = np.array(self.latencies) * 1e3
+        return {"requests": self.requests, "queue_depth": self.queue.qsize(),
+                "batch_sizes": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                "latency_ms": {"p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                               "p99": float(np.percentile(latencies, 99)) if len(latencies) else None}}
+
+def to_features(payload, input_shape):
+    if "mfcc" in payload:
+        x = np.asarray(payload["mfcc"], dtype=np.float32)
+    else:
+        audio = np.asarray(payload["audio"], dtype=np.float32)
+        sr = payload.get("sr", SR)
+        if sr != SR:   # resampled as librosa.load does for features.load_wav
+            audio = librosa.resample(audio, orig_sr=sr, target_sr=SR)
+        audio = (audio - np.mean(audio)) / np.std(audio)   # as features.load_wav
+        x = mfcc(pad_sequence([audio], maxlen=MAXLEN))[0]
+    if x.shape != tuple(input_shape):
+        raise ValueError(f"expected features of shape {tuple(input_shape)}, got {x.shape}")
+    return x
+
+async def read_request(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    method, path, _ = line.decode().split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, value = line.decode().split(":", 1)
+        headers[key.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, headers, body
+
+def response(status, payload):
+    body = json.dumps(payload).encode()
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+    return (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+class Server:
+    def __init__(self, batcher, input_shape, feature_workers=4):
+        self.batcher = batcher
+        self.input_shape = input_shape
+        self.features = ThreadPoolExecutor(feature_workers)   # MFCC for audio payloads
+
+    async def handle(self, reader, writer):
+        try:
+            while True:   # keep-alive: one connection per client device
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                writer.write(await self.route(method, path, body))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/metrics":
+            return response(200, self.batcher.metrics())
+        if method == "GET" and path == "/health":
+            return response(200, {"status": "ok"})
+        if method != "POST" or path != "/predict":
+            return response(404, {"error": f"{method} {path}"})
+        try:
+            payload = json.loads(body)
+            x = await asyncio.get_running_loop().run_in_executor(self.features, to_features, payload, self.input_shape)
+        except (ValueError, KeyError) as e:
+            return response(400, {"error": str(e)})
+        try:
+            probs, n = await self.batcher.submit(x)
+        except Exception as e:
+            return response(500, {"error": repr(e)})
+        return response(200, {"probabilities": probs.tolist(), "prediction": int(np.argmax(probs)), "batch_size": n})
+
+async def main(predict, input_shape, host="127.0.0.1", port=8080, max_batch=32, max_wait=0.005):
+    batcher = MicroBatcher(predict, max_batch, max_wait)
+    server = Server(batcher, input_shape)
+    worker = asyncio.create_task(batcher.run())
+    async with await asyncio.start_server(server.handle, host, port) as s:
+        print(f"serving on http://{host}:{port} (max_batch={max_batch}, max_wait={max_wait * 1e3:.1f}ms)")
+        await s.serve_forever()
+    worker.cancel()
+
+if __name__ == "__main__":
+    import tensorflow as tf
+    from infer import load_checkpoint
+    checkpoint = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    max_batch = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    max_wait = float(sys.argv[4]) / 1e3 if len(sys.argv) > 4 else 0.005
+    try:
+        model = load_checkpoint(checkpoint, max_batch, serving=True)
+    except ValueError as e:   # an older layers.py without serving mode: sampled attention as in training
+        print(f"{e}, serving with the training attention")
+        model = load_checkpoint(checkpoint, max_batch)
+    step = tf.function(lambda x: model(x, training=False))
+    predict = lambda x: step(tf.constant(x, tf.float32)).numpy()
+    predict(np.zeros((max_batch, *model.input_shape[1:]), dtype=np.float32))   # trace before the first request
+    asyncio.run(main(predict, model.input_shape[1:], port=port, max_batch=max_batch, max_wait=max_wait))
@@ -0,0 +1,167 @@
+import os
+import sys
+import csv
+import time
+import numpy as np
+from scipy.stats import binom, norm, rankdata
+from evaluation import CLASSES, load_outputs, load_labels, precision_recall_f1
+
+# Bootstrap confidence intervals and paired tests over the stored outputs of every model:
+#   python significance.py [root] [--resamples 5000] [--reference metrics/Proposed]
+#   -> Tables/bootstrap_ci.csv, Tables/significance.csv
+# A resample is a row of per-recording counts W [resamples, N]. Every metric is a weighted sum over
+# recordings, so all resamples of all models come out of a few matrix products instead of a loop.
+# The same W is used for every model, so differences between models are paired bootstrap estimates.
+
+RESAMPLES = 5000
+LEVEL = 0.95
+
+def resample_counts(n, resamples=RESAMPLES, seed=0):
+    # [resamples, n]: how often each recording is drawn in each resample
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, n, (resamples, n)) + n * np.arange(resamples)[:, None]
+    return np.bincount(index.ravel(), minlength=resamples * n).reshape(resamples, n).astype(np.float64)
+
+def padded_index(mask):
+    # mask [N, C] -> [C, K] indices of the set rows of every column, padded to the longest, and their validity
+    counts = mask.sum(0)
+    index = np.argsort(~mask, axis=0, kind="stable")[:counts.max()].T
+    return index, np.arange(index.shape[1]) < counts[:, None]
+
+def weighted_auc(targets, scores, W, chunk=100):
+    # targets [N, C] / scores [..., N, C], W [B, N] -> AUC [..., C, B]; ties count one half as in roc_auc_score.
+    # Per class the negatives are sorted by score once, their resampled weights summed cumulatively, and every
+    # positive reads the weight of the negatives below / level with it at the two ends of its tie range.
+    # All models and classes go together; classes are padded to equal counts with a zero-weight recording.
+    if targets.ndim == 1:
+        return weighted_auc(targets[:, None], scores[..., None], W, chunk)[..., 0, :]
+    N = len(targets)
+    classes = np.arange(targets.shape[1])[:, None]
+    pos, pos_valid = padded_index(targets == 1)                                       # [C, P]
+    neg, neg_valid = padded_index(targets == 0)                                       # [C, Q]
+    s_pos = scores[..., pos, classes]                                                 # [..., C, P]
+    s_neg = np.where(neg_valid, scores[..., neg, classes], np.inf)                    # [..., C, Q]
+    order = np.argsort(s_neg, axis=-1)
+    s_neg = np.take_along_axis(s_neg, order, -1)
+    pos, neg = np.where(pos_valid, pos, N), np.where(neg_valid, neg, N)              # padding: the zero row N
+    sorted_neg = neg[classes, order]                                                  # [..., C, Q]
+    # negatives strictly below / below or level with each positive, as rows of the flattened cumulative sums
+    low = np.sum(s_neg[..., None, :] < s_pos[..., None], axis=-1)                     # [..., C, P]
+    high = np.sum(s_neg[..., None, :] <= s_pos[..., None], axis=-1)
+    start = np.arange(low.size // low.shape[-1]).reshape(low.shape[:-1] + (1,)) * (s_neg.shape[-1] + 1)
+    low, high = (start + low).ravel(), (start + high).ravel()
+    # counts, halves and their sums below 2**24 are exact in float32
+    Wt = np.concatenate([W.T, np.zeros((1, len(W)))]).astype(np.float32)              # [N + 1, B], row N: padding
+    num = []
+    for i in range(0, len(W), chunk):
+        w = Wt[:, i:i+chunk]
+        cum = np.zeros(sorted_neg.shape[:-1] + (sorted_neg.shape[-1] + 1, w.shape[-1]), np.float32)
+        np.cumsum(w[sorted_neg], axis=-2, out=cum[..., 1:, :])                        # [..., C, Q + 1, b]
+        cum = cum.reshape(-1, w.shape[-1])
+        below = (cum[low] + cum[high]).reshape(s_pos.shape + (-1,))                   # [..., C, P, b]
+        num.append(np.sum(w[pos] * below, axis=-2) / 2)                              # [..., C, b]
+    num = np.concatenate(num, axis=-1).astype(np.float64)
+    # a resample without positives (or negatives) of the class has no AUC: NaN, skipped by interval()
+    pairs = np.broadcast_to(Wt[pos].sum(-2) * Wt[neg].sum(-2), num.shape)
+    return np.divide(num, pairs, out=np.full(num.shape, np.nan), where=pairs > 0)
+
+def bootstrap(probs, y_true, W):
+    # probs [M, N, C] -> bootstrap distributions [M, B] of accuracy, macro F1 and macro AUC
+    M, N, C = probs.shape
+    y_pred = np.argmax(probs, axis=-1)
+    accuracy = (y_pred == y_true).astype(np.float64) @ W.T / N
+    pairs = np.eye(C * C)[y_true * C + y_pred]                                  # [M, N, C * C]
+    cm = np.einsum("bn,mnk->mbk", W, pairs, optimize=True).reshape(M, len(W), C, C)
+    _, averages = precision_recall_f1(cm)
+    targets = np.eye(C)[y_true]
+    auc = np.mean(weighted_auc(targets, probs, W), axis=1)
+    return {"accuracy": accuracy, "macro_f1": averages["macro"]["f1"], "macro_auc": auc}
+
+def interval(dist, level=LEVEL):
+    # percentile interval over the last axis, degenerate (NaN) resamples left out
+    return np.nanpercentile(dist, [100 * (1 - level) / 2, 100 * (1 + level) / 2], axis=-1)
+
+def mcnemar(correct):
+    # correct [M, N] -> discordant counts b (i right, j wrong), c and exact two-sided p-values [M, M]
+    correct = correct.astype(np.float64)
+    b = correct @ (1 - correct).T
+    c = b.T
+    p = np.minimum(1., 2 * binom.cdf(np.minimum(b, c), b + c, 0.5))
+    return b.astype(int), c.astype(int), p
+
+def delong(targets, scores):
+    # targets [N] 0/1, scores [M, N] -> AUC [M] and its covariance [M, M] (DeLong, computed from midranks)
+    pos, neg = scores[:, targets == 1], scores[:, targets == 0]
+    m, n = pos.shape[1], neg.shape[1]
+    tz = rankdata(np.concatenate([pos, neg], axis=-1), axis=-1)
+    tx, ty = rankdata(pos, axis=-1), rankdata(neg, axis=-1)
+    auc = (tz[:, :m].sum(axis=-1) / m - (m + 1) / 2) / n
+    v10 = (tz[:, :m] - tx) / n
+    v01 = 1 - (tz[:, m:] - ty) / m
+    cov = np.atleast_2d(np.cov(v10)) / m + np.atleast_2d(np.cov(v01)) / n
+    return auc, cov
+
+def delong_test(targets, scores):
+    # two-sided p-values [M, M] for equal AUC of every pair of models on the same recordings
+    auc, cov = delong(targets, scores)
+    var = np.diag(cov)[:, None] + np.diag(cov)[None, :] - 2 * cov
+    z = np.divide(auc[:, None] - auc[None, :], np.sqrt(np.maximum(var, 0)), out=np.zeros_like(var), where=var > 0)
+    return auc, 2 * norm.sf(np.abs(z))
+
+def compare(outputs, y_true, resamples=RESAMPLES, reference=None, seed=0):
+    names = list(outputs)
+    probs = np.stack([outputs[name] for name in names])
+    W = resample_counts(len(y_true), resamples, seed)
+    dists = bootstrap(probs, y_true, W)
+    ref = names.index(reference) if reference in names else 0
+    correct = np.argmax(probs, axis=-1) == y_true
+    b, c, p_mcnemar = mcnemar(correct)
+    targets = np.eye(probs.shape[-1])[y_true]
+    p_class = np.stack([delong_test(targets[:, k], probs[:, :, k])[1] for k in range(probs.shape[-1])])   # [C, M, M]
+    # micro AUC: every (recording, class) pair as one binary decision, as in Ablation Study/ROC.pdf
+    _, p_micro = delong_test(targets.ravel(), probs.reshape(len(names), -1))
+    return {"names": names, "reference": ref, "dists": dists, "b": b, "c": c, "p_mcnemar": p_mcnemar,
+            "p_delong": p_class, "p_delong_micro": p_micro}
+
+def write_tables(results, tables="Tables", level=LEVEL):
+    os.makedirs(tables, exist_ok=True)
+    names, ref, dists = results["names"], results["reference"], results["dists"]
+    with open(os.path.join(tables, "bootstrap_ci.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        header = ["model"]
+        for metric in dists:
+            header += [f"{metric}_mean", f"{metric}_low", f"{metric}_high",
+                       f"{metric}_diff_low", f"{metric}_diff_high"]   # paired difference to the reference
+        writer.writerow(header)
+        for i, name in enumerate(names):
+            row = [name]
+            for dist in dists.values():
+                row += [f"{np.nanmean(dist[i]):.6f}", *(f"{v:.6f}" for v in interval(dist[i], level)),
+                        *(f"{v:.6f}" for v in interval(dist[i] - dist[ref], level))]
+            writer.writerow(row)
+    with open(os.path.join(tables, "significance.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["model", "reference", "only_model_correct", "only_reference_correct", "mcnemar_p",
+                         "delong_micro_p"] + [f"delong_{label}_p" for label in CLASSES])
+        for i, name in enumerate(names):
+            if i != ref:
+                writer.writerow([name, names[ref], results["b"][i, ref], results["c"][i, ref],
+                                 f"{results['p_mcnemar'][i, ref]:.6g}", f"{results['p_delong_micro'][i, ref]:.6g}"]
+                                + [f"{p:.6g}" for p in results["p_delong"][:, i, ref]])
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    resamples = int(args[args.index("--resamples") + 1]) if "--resamples" in args else RESAMPLES
+    reference = args[args.index("--reference") + 1] if "--reference" in args else "metrics/Proposed"
+    root = args[0] if args and not args[0].startswith("--") else "."
+    start = time.perf_counter()
+    outputs = load_outputs(root)
+    results = compare(outputs, load_labels(root), resamples, reference)
+    write_tables(results, os.path.join(root, "Tables"))
+    names, ref, dists = results["names"], results["reference"], results["dists"]
+    print(f"{len(names)} models, {resamples} resamples, reference {names[ref]} ({time.perf_counter() - start:.1f}s)")
+    print(f"{'model':<48}" + "".join(f"{metric:>24}" for metric in dists) + f"{'McNemar p':>11}{'DeLong p':>10}")
+    for i, name in enumerate(names):
+        cells = "".join(f"{np.nanmean(dist[i]):>8.4f} [{interval(dist[i])[0]:.4f}, {interval(dist[i])[1]:.4f}]"
+                        for dist in dists.values())
+        print(f"{name:<48}{cells}{results['p_mcnemar'][i, ref]:>11.3g}{results['p_delong_micro'][i, ref]:>10.3g}")
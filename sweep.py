@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import itertools
+import multiprocessing
+import numpy as np
+
+# Grid sweeps described by a JSON config:
+#   {"name": ..., "trial": "lr_warmup" | "pretrain_eps", "path": dir holding layers.py,
+#    "data": "mfcc.npz", "train": [0, 700], "val": [700, 850], "store": "sweeps.db",
+#    "fixed": {...}, "grid": {"param": [values], "group": [{"a": 1, "b": 2}, ...]},
+#    "asha": {"grace_period": 100, "max_epochs": 2000}, "pretrain_cache": {"max_bytes": 2**31}}
+# A grid entry holding dicts sets several parameters together. Relative paths are relative to the config.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def expand_grid(grid):
+    keys = list(grid)
+    for combo in itertools.product(*(grid[key] for key in keys)):
+        params = {}
+        for key, value in zip(keys, combo):
+            if isinstance(value, dict):
+                params.update(value)
+            else:
+                params[key] = value
+        yield params
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for key in ("path", "data", "store", "history"):
+        if key in config:
+            config[key] = os.path.join(base, config[key])
+    config.setdefault("store", os.path.join(base, "sweeps.db"))
+    return config
+
+class SweepStore:
+    # persistent work queue and result table shared by all sweeps and workers
+    def __init__(self, path="sweeps.db"):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS trials (sweep TEXT, key TEXT, params TEXT, status TEXT, "
+                         "result TEXT, worker INTEGER, started REAL, finished REAL, PRIMARY KEY (sweep, key))")
+            conn.execute("CREATE INDEX IF NOT EXISTS trials_status ON trials (sweep, status)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def enqueue(self, sweep, params_list):
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO trials (sweep, key, params, status) VALUES (?, ?, ?, 'pending')",
+                             [(sweep, json.dumps(p, sort_keys=True), json.dumps(p)) for p in params_list])
+            return conn.total_changes - before
+
+    def requeue_unfinished(self, sweep):
+        # trials left 'running' by a killed process start over; 'done' trials are skipped
+        with self._connect() as conn:
+            conn.execute("UPDATE trials SET status = 'pending', worker = NULL WHERE sweep = ? AND status = 'running'",
+                         (sweep,))
+
+    def claim(self, sweep, worker):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT key, params FROM trials WHERE sweep = ? AND status = 'pending' "
+                               "ORDER BY rowid LIMIT 1", (sweep,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE trials SET status = 'running', worker = ?, started = ? WHERE sweep = ? AND key = ?",
+                             (worker, time.time(), sweep, row[0]))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def complete(self, sweep, key, result, status="done"):
+        with self._connect() as conn:
+            conn.execute("UPDATE trials SET status = ?, result = ?, finished = ? WHERE sweep = ? AND key = ?",
+                         (status, json.dumps(result), time.time(), sweep, key))
+
+    def results(self, sweep):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT params, result FROM trials WHERE sweep = ? AND status = 'done' ORDER BY rowid",
+                                (sweep,)).fetchall()
+        return [(json.loads(p), json.loads(r)) for p, r in rows]
+
+    def counts(self, sweep):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM trials WHERE sweep = ? GROUP BY status", (sweep,)))
+
+def _pin(worker, cpus_per_worker):
+    if cpus_per_worker and hasattr(os, "sched_setaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+        cpus = available[worker * cpus_per_worker:(worker + 1) * cpus_per_worker]
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+
+def asha_scheduler(config):
+    # one search id per sweep, shared by its workers; a resumed sweep keeps ranking against its own rungs
+    from scheduler import ASHA
+    return ASHA(os.path.splitext(config["store"])[0] + f"-{config['name']}-asha.db", search=config["name"],
+                **config["asha"])
+
+def run_worker(config, worker, cpus_per_worker):
+    _pin(worker, cpus_per_worker)
+    sys.path.insert(0, ROOT)
+    if "path" in config:
+        sys.path.insert(0, config["path"])   # the layers.py the sweep was written against
+    import tensorflow as tf
+    if cpus_per_worker:
+        tf.config.threading.set_intra_op_parallelism_threads(cpus_per_worker)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    from grid_search import TRIALS, load_data
+    from scheduler import keras_callback
+    from pretrain_cache import PretrainCache
+
+    data = load_data(config["data"], config.get("train", (0, 700)), config.get("val", (700, 850)))
+    scheduler = None
+    if "asha" in config:
+        scheduler = asha_scheduler(config)
+    store = SweepStore(config["store"])
+    kwargs = {}
+    if config["trial"] == "pretrain_eps":
+        kwargs["pretrain_cache"] = PretrainCache(os.path.join(os.path.dirname(config["store"]), "pretrain_cache"),
+                                                 **config.get("pretrain_cache", {}))
+    while True:
+        claimed = store.claim(config["name"], worker)
+        if claimed is None:
+            break
+        key, params = claimed
+        hyperparameters = {**config["fixed"], **params}
+        callbacks = []
+        if scheduler is not None:
+            callbacks.append(keras_callback(scheduler, key))
+        try:
+            result = TRIALS[config["trial"]](data, callbacks=callbacks, **kwargs, **hyperparameters)
+        except Exception as e:
+            print(f"worker {worker}: trial {key} failed: {e!r}")
+            store.complete(config["name"], key, {"error": repr(e)}, status="failed")
+            continue
+        if scheduler is not None:
+            report = callbacks[0].report
+            scheduler.finish(key, report.epochs, hyperparameters["epochs"], report.stopped)
+            result["epochs"], result["stopped"] = report.epochs, report.stopped
+        store.complete(config["name"], key, result)
+    if "pretrain_cache" in kwargs:
+        cache = kwargs["pretrain_cache"]
+        print(f"worker {worker}: pretraining cache {cache.hits} hits, {cache.misses} misses")
+
+def run_sweep(config_path, n_workers=None, cpus_per_worker=None):
+    config = load_config(config_path)
+    store = SweepStore(config["store"])
+    added = store.enqueue(config["name"], list(expand_grid(config["grid"])))
+    store.requeue_unfinished(config["name"])
+    counts = store.counts(config["name"])
+    print(f"{config['name']}: {added} new trials, {counts.get('done', 0)} already done, "
+          f"{counts.get('pending', 0)} to run")
+    if not counts.get("pending"):
+        return store.results(config["name"])   # finished: no worker process, so no TensorFlow start-up
+    if "asha" in config and not counts.get("done"):
+        asha_scheduler(config).reset()   # a fresh sweep is not ranked against rungs of an earlier run
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    if n_workers is None:
+        n_workers = max(cpus // (cpus_per_worker or 4), 1)
+    if cpus_per_worker is None:
+        cpus_per_worker = max(cpus // n_workers, 1)
+    n_workers = min(n_workers, counts["pending"])
+
+    start = time.time()
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=run_worker, args=(config, i, cpus_per_worker)) for i in range(n_workers)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    print(f"{config['name']}: {store.counts(config['name'])} in {time.time() - start:.1f}s")
+    return store.results(config["name"])
+
+def export_history(results, path):
+    # the list of {param: value, ..., "logs": {...}} saved by the old scripts, read by visual*.ipynb
+    np.save(path, [{**params, "logs": result} for params, result in results])
+
+if __name__ == "__main__":
+    config_path = sys.argv[1]
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    results = run_sweep(config_path, n_workers=n_workers)
+    config = load_config(config_path)
+    if "history" in config:
+        export_history(results, config["history"])
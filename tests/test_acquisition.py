@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern
+from gaussian_process import GaussianProcess, Matern52, RBF, expected_improvement
+from acquisition import EIOptimizer, from_sklearn
+
+PBOUNDS = {"a": (0., 2.), "b": (-1., 1.)}
+
+def data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.uniform([0, -1], [2, 1], (n, 2))
+    return X, np.sin(2 * X[:, 0]) * X[:, 1] + 3
+
+def test_from_sklearn_matches_bayes_opt_gp():
+    # bayes_opt's GP: Matern 5/2, normalize_y, per-point noise
+    X, Y = data(30)
+    gp = GaussianProcessRegressor(Matern(nu=2.5), alpha=np.linspace(1e-6, 1e-2, 30), normalize_y=True).fit(X, Y)
+    x_test, _ = data(20, seed=1)
+    mu, std = gp.predict(x_test, return_std=True)
+    mu_gp, var_gp = from_sklearn(gp, 2).predict(x_test)
+    np.testing.assert_allclose(mu_gp, mu, rtol=1e-8)
+    np.testing.assert_allclose(np.sqrt(var_gp), std, rtol=1e-6, atol=1e-9)
+
+@pytest.mark.parametrize("kernel", [Matern52(sigma=1.2, theta=np.array([0.5, 0.3])), RBF(l=0.4, sigma=0.8)])
+def test_ei_matches_numpy_and_update_does_not_retrace(kernel):
+    X, Y = data(25)
+    GP = GaussianProcess(2, kernel, noise_var=1e-4).fit(X[:15], Y[:15])
+    optimizer = EIOptimizer(GP, PBOUNDS, n_starts=8, n_candidates=64, iterations=5)
+    u = np.random.default_rng(2).uniform(size=(10, 2))
+    for n in (15, 20, 25):
+        GP = GaussianProcess(2, kernel, noise_var=1e-4).fit(X[:n], Y[:n])
+        optimizer.update(GP)
+        x = np.array([0., -1.]) + u * np.array([2., 2.])
+        mu, var = GP.predict(x)
+        np.testing.assert_allclose(optimizer.ei(u).numpy(), expected_improvement(mu, var, np.max(GP.predict(X[:n])[0])),
+                                   rtol=1e-6, atol=1e-10)
+        params, _ = optimizer.propose(seed=n)
+        assert all(PBOUNDS[k][0] <= v <= PBOUNDS[k][1] for k, v in params.items())
+    assert optimizer.traces() == 2
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support, roc_curve, roc_auc_score, auc
+from evaluation import confusion_matrices, precision_recall_f1, roc_curves, one_vs_rest, by_fold
+
+C = 5
+
+@pytest.fixture
+def outputs():
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, C, 200)
+    probs = rng.dirichlet(np.ones(C), (3, 200))
+    probs[0, np.arange(200), y_true] += 0.5     # one good model, two at chance
+    probs[2] = np.round(probs[2], 1)            # ties in the scores
+    return y_true, probs / probs.sum(-1, keepdims=True)
+
+def test_confusion_matrices_match_sklearn(outputs):
+    y_true, probs = outputs
+    cm = confusion_matrices(y_true, probs)
+    for m in range(len(probs)):
+        np.testing.assert_array_equal(cm[m], confusion_matrix(y_true, probs[m].argmax(-1), labels=range(C)))
+
+@pytest.mark.parametrize("average", ["macro", "weighted"])
+def test_precision_recall_f1_match_sklearn(outputs, average):
+    y_true, probs = outputs
+    per_class, averages = precision_recall_f1(confusion_matrices(y_true, probs))
+    for m in range(len(probs)):
+        y_pred = probs[m].argmax(-1)
+        p, r, f, s = precision_recall_fscore_support(y_true, y_pred, labels=range(C), zero_division=0)
+        np.testing.assert_allclose(per_class["precision"][m], p)
+        np.testing.assert_allclose(per_class["recall"][m], r)
+        np.testing.assert_allclose(per_class["f1"][m], f)
+        np.testing.assert_array_equal(per_class["support"][m], s)
+        p, r, f, _ = precision_recall_fscore_support(y_true, y_pred, labels=range(C), average=average,
+                                                     zero_division=0)
+        np.testing.assert_allclose([averages[average][k][m] for k in ("precision", "recall", "f1")], [p, r, f])
+        assert averages["accuracy"][m] == pytest.approx(np.mean(y_pred == y_true))
+
+def test_empty_class_has_zero_scores():
+    y_true = np.array([0, 0, 1, 1])
+    probs = np.eye(3)[[0, 1, 1, 1]]
+    per_class, _ = precision_recall_f1(confusion_matrices(y_true, probs))
+    np.testing.assert_array_equal(per_class["f1"][2], 0.)
+
+def test_roc_curves_match_sklearn(outputs):
+    y_true, probs = outputs
+    (fpr, tpr, aucs), (micro_fpr, micro_tpr, micro_auc) = one_vs_rest(y_true, probs)
+    targets = np.eye(C)[y_true]
+    for m in range(len(probs)):
+        for c in range(C):
+            np.testing.assert_allclose(aucs[m, c], roc_auc_score(targets[:, c], probs[m, :, c]))
+            # the same curve as sklearn's, which drops collinear points
+            ref_fpr, ref_tpr, _ = roc_curve(targets[:, c], probs[m, :, c], drop_intermediate=False)
+            assert set(zip(ref_fpr.round(12), ref_tpr.round(12))) == set(zip(fpr[m, c].round(12), tpr[m, c].round(12)))
+        assert micro_auc[m] == pytest.approx(roc_auc_score(targets.ravel(), probs[m].ravel()))
+        assert micro_auc[m] == pytest.approx(auc(micro_fpr[m], micro_tpr[m]))
+
+def test_roc_all_tied_scores_is_chance():
+    _, _, a = roc_curves(np.array([0, 1, 0, 1]), np.full(4, 0.3))
+    assert a == pytest.approx(0.5)
+
+def test_by_fold_keeps_every_recording_once(outputs):
+    _, probs = outputs
+    folds = by_fold(probs)
+    assert folds.shape == (3, 10, 20, C)
+    np.testing.assert_array_equal(np.sort(folds.reshape(3, -1, C), axis=1), np.sort(probs, axis=1))
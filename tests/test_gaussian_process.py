@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, RBF as SkRBF, Matern as SkMatern
+from gaussian_process import GaussianProcess, RBF, Matern52, chol_update, expected_improvement
+
+NOISE = 1e-2
+
+def f(x):
+    return np.sin(3 * x[:, 0]) + x[:, 1] ** 2
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(-1, 1, (40, 2))
+    return X, f(X), rng.uniform(-1, 1, (25, 2))
+
+def full_fit(X, Y, kernel=None):
+    return GaussianProcess(2, kernel or Matern52(sigma=1.5, theta=0.7), noise_var=NOISE).fit(X, Y)
+
+def assert_same(gp, ref, x_test):
+    np.testing.assert_allclose(gp.L, ref.L, atol=1e-8)
+    np.testing.assert_allclose(gp.alpha, ref.alpha, rtol=1e-6, atol=1e-8)
+    for a, b in zip(gp.predict(x_test), ref.predict(x_test)):
+        np.testing.assert_allclose(a, b, rtol=1e-6, atol=1e-9)
+    assert gp.log_marginal_likelihood() == pytest.approx(ref.log_marginal_likelihood())
+
+def test_fit_matches_numpy_cholesky(data):
+    X, Y, _ = data
+    gp = full_fit(X, Y)
+    K = gp.kernel(X, X) + np.eye(len(X)) * (NOISE + gp.jitter)
+    np.testing.assert_allclose(gp.L, np.linalg.cholesky(K), atol=1e-12)
+    np.testing.assert_allclose(gp.alpha, np.linalg.solve(K, Y), rtol=1e-8)
+
+@pytest.mark.parametrize("batch", [1, 5])
+def test_add_observation_matches_fit(data, batch):
+    X, Y, x_test = data
+    gp = full_fit(X[:20], Y[:20])
+    for i in range(20, len(X), batch):
+        gp.add_observation(X[i:i+batch], Y[i:i+batch])
+    assert_same(gp, full_fit(X, Y), x_test)
+
+@pytest.mark.parametrize("k", [0, 17, 39])
+def test_remove_observation_matches_fit(data, k):
+    X, Y, x_test = data
+    gp = full_fit(X, Y).remove_observation(k)
+    assert_same(gp, full_fit(np.delete(X, k, axis=0), np.delete(Y, k)), x_test)
+
+@pytest.mark.parametrize("retain", ["window", "best"])
+def test_max_observations_matches_fit_on_kept_points(data, retain):
+    X, Y, x_test = data
+    gp = GaussianProcess(2, Matern52(sigma=1.5, theta=0.7), noise_var=NOISE, max_observations=15, retain=retain)
+    gp.fit(X[:10], Y[:10])
+    for i in range(10, len(X)):
+        gp.add_observation(X[i], Y[i])
+    # the same points a single fit() with the cap keeps
+    ref = GaussianProcess(2, Matern52(sigma=1.5, theta=0.7), noise_var=NOISE, max_observations=15, retain=retain)
+    if retain == "window":
+        ref.fit(X, Y)
+        assert_same(gp, ref, x_test)
+    else:
+        # "best" evicts one point at a time, so it keeps the top of the running set, not of all points
+        keep = [int(np.argmin(np.abs(Y - y))) for y in gp.Y]
+        assert_same(gp, full_fit(X[keep], Y[keep]), x_test)
+        assert len(gp.Y) == 15
+
+def test_chol_update_matches_numpy(data):
+    X, _, _ = data
+    A = Matern52()(X, X) + np.eye(len(X)) * 1e-3
+    x = np.random.default_rng(1).normal(size=len(X))
+    np.testing.assert_allclose(chol_update(np.linalg.cholesky(A), x), np.linalg.cholesky(A + np.outer(x, x)),
+                               atol=1e-10)
+
+@pytest.mark.parametrize("kernel, sk_kernel", [
+    (RBF(l=0.5, sigma=1.3), ConstantKernel(1.3**2) * SkRBF(length_scale=0.5)),
+    (Matern52(sigma=0.8, theta=0.4), ConstantKernel(0.8**2) * SkMatern(length_scale=0.4, nu=2.5)),
+])
+def test_predict_matches_sklearn(data, kernel, sk_kernel):
+    X, Y, x_test = data
+    gp = full_fit(X, Y, kernel)
+    sk = GaussianProcessRegressor(sk_kernel, alpha=NOISE + gp.jitter, optimizer=None).fit(X, Y)
+    mu, std = sk.predict(x_test, return_std=True)
+    mu_gp, var_gp = gp.predict(x_test)
+    np.testing.assert_allclose(mu_gp, mu, rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(np.sqrt(var_gp), std, rtol=1e-5, atol=1e-7)
+    _, cov = sk.predict(x_test, return_cov=True)
+    np.testing.assert_allclose(gp.predict(x_test, full_cov=True)[1], cov, atol=1e-8)
+    assert gp.log_marginal_likelihood() == pytest.approx(sk.log_marginal_likelihood_value_, rel=1e-6)
+
+def test_expected_improvement_zero_variance():
+    ei = expected_improvement(np.array([1., 2.]), np.array([0., 0.]), mu_max=1.5)
+    np.testing.assert_allclose(ei, [0., 0.5])
@@ -0,0 +1,36 @@
+import os
+import numpy as np
+import pytest
+import tensorflow as tf
+import layers as default_layers
+from training import build_model
+from infer import load_layers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = {"root": None, "Config-Oct-9": os.path.join(ROOT, "Config-Oct-9")}
+
+def layers_module(name):
+    return None if MODULES[name] is None else load_layers(None, MODULES[name])
+
+@pytest.mark.parametrize("name", MODULES)
+@pytest.mark.parametrize("serving", [False, True])
+def test_batch_one(name, serving):
+    # ProbSparseAttention squeezes only the sample axis, so a single recording keeps its batch axis
+    tf.random.set_seed(0)
+    model = build_model(num_heads=[8, 4], input_shape=(137, 15), batch_size=1, serving=serving,
+                        layers=layers_module(name))
+    probs = model(np.random.default_rng(0).normal(size=(1, 137, 15)).astype(np.float32), training=False)
+    assert probs.shape == (1, 5)
+    np.testing.assert_allclose(np.sum(probs), 1., rtol=1e-5)
+
+@pytest.mark.parametrize("name", MODULES)
+def test_serving_keep_all_heads(name):
+    x = np.random.default_rng(1).normal(size=(2, 137, 15)).astype(np.float32)
+    full = build_model(num_heads=[8, 4], batch_size=2, serving=True, layers=layers_module(name))
+    kept = build_model(num_heads=[8, 4], batch_size=2, serving=True, keep_heads=[list(range(8)), list(range(4))],
+                       layers=layers_module(name))
+    kept.set_weights(full.get_weights())
+    np.testing.assert_allclose(kept(x, training=False), full(x, training=False), rtol=1e-5, atol=1e-6)
+
+def test_checkpoint_layers_resolved():
+    assert layers_module("Config-Oct-9") is not default_layers
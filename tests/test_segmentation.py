@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from segmentation import ENV_SR, pad_batch, shannon_envelope, heart_period, find_s1, segment, aggregate
+from features import SR
+
+def heart_sounds(bpm, seconds=8., sr=SR, seed=0):
+    # S1 / S2 as short 60 Hz / 90 Hz bursts, systole one third of the cycle, plus noise
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    period = 60 / bpm
+    x = rng.normal(0, 0.02, len(t))
+    for start in np.arange(0.1, seconds - 0.2, period):
+        for onset, freq in ((start, 60), (start + period / 3, 90)):
+            burst = (t >= onset) & (t < onset + 0.06)
+            x[burst] += np.sin(2 * np.pi * freq * (t[burst] - onset)) * np.hanning(burst.sum())
+    return x.astype(np.float32), period
+
+def test_heart_period_matches_numpy_autocorrelation():
+    x = [heart_sounds(bpm, seconds=s, seed=i)[0] for i, (bpm, s) in enumerate([(60, 8), (75, 6), (110, 7)])]
+    batch, lengths = pad_batch(x)
+    env = shannon_envelope(batch)
+    env_lengths = lengths * ENV_SR // SR
+    periods = heart_period(env, env_lengths)
+    lo, hi = int(ENV_SR * 60 / 180), int(ENV_SR * 60 / 40)
+    for i, n in enumerate(env_lengths):
+        ac = np.correlate(env[i, :n], env[i, :n], mode="full")[n - 1:]
+        assert periods[i] == lo + np.argmax(ac[lo:hi])
+
+@pytest.mark.parametrize("bpm", [60, 75, 110])
+def test_heart_period_recovers_heart_rate(bpm):
+    x, period = heart_sounds(bpm)
+    batch, lengths = pad_batch([x])
+    assert heart_period(shannon_envelope(batch), lengths * ENV_SR // SR)[0] == pytest.approx(period * ENV_SR, abs=2)
+
+def test_find_s1_picks_one_onset_per_cycle():
+    x, period = heart_sounds(75)
+    env = shannon_envelope(x[None])[0]
+    s1 = find_s1(env, int(period * ENV_SR))
+    assert len(s1) >= 8
+    np.testing.assert_allclose(np.diff(s1), period * ENV_SR, atol=3)
+    # S1 bursts start at 0.1 s + k * period
+    assert np.all(np.abs(((s1 / ENV_SR - 0.1) + period / 2) % period - period / 2) < 0.06)
+
+def test_segment_cuts_windows_from_each_recording():
+    x = [heart_sounds(75)[0], heart_sounds(90, seconds=1.)[0]]
+    windows, recording = segment(x, window=1.6)
+    assert windows.shape[1] == int(1.6 * SR)
+    assert set(recording) == {0, 1}
+    # the short recording is zero padded to one window
+    short = windows[recording == 1]
+    assert len(short) == 1 and np.all(short[0, len(x[1]):] == 0)
+    heads = np.lib.stride_tricks.sliding_window_view(x[0], 32)
+    for w in windows[recording == 0]:
+        start = np.flatnonzero(np.all(heads == w[:32], axis=1))
+        assert len(start) == 1 and np.array_equal(x[0][start[0]:start[0] + len(w)], w)
+
+@pytest.mark.parametrize("method", ["mean", "vote", "log"])
+def test_aggregate_matches_loop(method):
+    rng = np.random.default_rng(0)
+    probs = rng.dirichlet(np.ones(5), 40)
+    recording = rng.integers(0, 6, 40) * 3
+    ids, out = aggregate(probs, recording, method)
+    np.testing.assert_array_equal(ids, np.unique(recording))
+    for i, r in enumerate(ids):
+        p = probs[recording == r]
+        if method == "mean":
+            ref = p.mean(0)
+        elif method == "vote":
+            ref = np.bincount(p.argmax(-1), minlength=5) / len(p)
+        else:
+            ref = np.exp(np.log(p).mean(0))
+            ref /= ref.sum()
+        np.testing.assert_allclose(out[i], ref, rtol=1e-9)
+
+def test_aggregate_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        aggregate(np.ones((2, 5)) / 5, np.array([0, 0]), "median")
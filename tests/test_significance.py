@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from scipy.stats import binomtest
+from sklearn.metrics import roc_auc_score
+from significance import resample_counts, weighted_auc, interval, mcnemar, delong, delong_test
+
+@pytest.fixture
+def scores():
+    rng = np.random.default_rng(0)
+    targets = rng.integers(0, 2, 120)
+    scores = np.stack([targets + rng.normal(0, s, 120) for s in (0.6, 1.0, 3.0)])
+    scores[1] = np.round(scores[1], 1)          # ties
+    return targets, scores
+
+def test_resample_counts_draw_n_per_resample():
+    W = resample_counts(50, 200)
+    assert W.shape == (200, 50)
+    np.testing.assert_array_equal(W.sum(-1), 50)
+
+def test_weighted_auc_matches_sklearn_on_resamples(scores):
+    targets, s = scores
+    W = resample_counts(len(targets), 20, seed=1)
+    auc = weighted_auc(targets, s[1], W)
+    for b in range(len(W)):
+        index = np.repeat(np.arange(len(targets)), W[b].astype(int))
+        assert auc[b] == pytest.approx(roc_auc_score(targets[index], s[1, index]))
+
+def test_weighted_auc_unit_weights_is_plain_auc(scores):
+    targets, s = scores
+    assert weighted_auc(targets, s[0], np.ones((1, len(targets))))[0] == pytest.approx(roc_auc_score(targets, s[0]))
+
+def test_weighted_auc_without_positives_is_nan():
+    targets = np.array([1, 0, 0, 1])
+    W = np.array([[0., 2., 2., 0.], [1., 1., 1., 1.]])
+    auc = weighted_auc(targets, np.array([.9, .1, .2, .8]), W)
+    assert np.isnan(auc[0]) and auc[1] == 1.
+    np.testing.assert_allclose(interval(auc), [1., 1.])
+
+def test_weighted_auc_batched_matches_columns():
+    # models x classes in one call, unequal class sizes, ties and a class without positives
+    rng = np.random.default_rng(2)
+    y = rng.choice(4, 90, p=[0.5, 0.3, 0.2, 0.])
+    probs = np.round(rng.dirichlet(np.ones(4), (3, 90)), 1)
+    W = resample_counts(90, 30, seed=3)
+    auc = weighted_auc(np.eye(4)[y], probs, W, chunk=7)
+    assert auc.shape == (3, 4, 30) and np.all(np.isnan(auc[:, 3]))
+    for m in range(3):
+        for c in range(3):
+            np.testing.assert_array_equal(auc[m, c], weighted_auc((y == c).astype(int), probs[m, :, c], W))
+            assert auc[m, c, 0] == pytest.approx(roc_auc_score(np.repeat(y == c, W[0].astype(int)),
+                                                               np.repeat(probs[m, :, c], W[0].astype(int))))
+
+def test_mcnemar_matches_binomtest():
+    rng = np.random.default_rng(0)
+    correct = rng.random((3, 80)) < [[0.9], [0.7], [0.5]]
+    b, c, p = mcnemar(correct)
+    for i in range(3):
+        for j in range(3):
+            assert b[i, j] == np.sum(correct[i] & ~correct[j])
+            assert c[i, j] == b[j, i]
+            if i != j:
+                assert p[i, j] == pytest.approx(binomtest(b[i, j], b[i, j] + c[i, j]).pvalue)
+
+def test_delong_auc_matches_sklearn(scores):
+    targets, s = scores
+    auc, cov = delong(targets, s)
+    np.testing.assert_allclose(auc, [roc_auc_score(targets, x) for x in s])
+    assert cov.shape == (3, 3) and np.all(np.diag(cov) > 0)
+
+def test_delong_test_separates_models(scores):
+    targets, s = scores
+    _, p = delong_test(targets, s)
+    np.testing.assert_allclose(p, p.T)
+    np.testing.assert_allclose(np.diag(p), 1.)
+    assert p[0, 2] < 0.01
@@ -0,0 +1,330 @@
+import tensorflow as tf
+from tensorflow import keras
+import numpy as np
+from sklearn.model_selection import KFold
+from layers import PositionalEmbedding, MultiHeadSelfAttention, FeedForward
+from augment import augment_dataset
+from pretrain_cache import get_state, set_state, optimizer_variables
+from tqdm import tqdm
+import datetime
+import inspect
+import time
+
+# create dataset for 10-fold cross validation
+def make_dataset(x_data,y_data,n_splits):
+    def gen():
+        for train_index, test_index in KFold(n_splits).split(x_data):
+            x_train, x_test = x_data[train_index], x_data[test_index]
+            y_train, y_test = y_data[train_index], y_data[test_index]
+            yield x_train,y_train,x_test,y_test
+
+    return tf.data.Dataset.from_generator(gen, (tf.float32,tf.float32,tf.float32,tf.float32))
+
+# build model & evaluation pipeline
+def build_model(d_model=64, num_heads=[64, 32], classes=5, input_shape=(137, 15), batch_size=32, serving=False,
+                keep_heads=None, layers=None, early_exit=False):
+    # serving=True: deterministic attention for export (layers.ProbSparseAttention), same weights
+    # keep_heads: per block, the head indices left after pruning (None keeps all), same weights
+    # Both are only passed when set: sweep.py builds against older layers.py files without them.
+    # layers: the layers module to build from (infer.load_layers), default the one imported above
+    # early_exit=True: outputs [final probs, probs of an "exit_head" Dense on the pooled first block]
+    embedding, attention, feed_forward = PositionalEmbedding, MultiHeadSelfAttention, FeedForward
+    if layers is not None:
+        embedding, attention, feed_forward = layers.PositionalEmbedding, layers.MultiHeadSelfAttention, layers.FeedForward
+    if (serving or keep_heads is not None) and "serving" not in inspect.signature(attention).parameters:
+        raise ValueError(f"{attention.__module__}.MultiHeadSelfAttention has no serving / keep_heads options")
+    inputs = keras.layers.Input(shape=input_shape, batch_size=batch_size)
+    x = embedding(d_model=d_model)(inputs)
+    pool = keras.layers.GlobalAveragePooling1D(data_format="channels_first")
+    for i, n_heads in enumerate(num_heads):
+        options = {}
+        if serving:
+            options["serving"] = True
+        if keep_heads is not None:
+            options["keep_heads"] = keep_heads[i]
+        x = attention(d_model=d_model, num_heads=n_heads, **options)(x)
+        x = feed_forward(d_model=d_model)(x)
+        if early_exit and i == 0:
+            exit_probs = keras.layers.Dense(classes, activation='softmax', name="exit_head")(pool(x))
+    x = pool(x)
+    x = keras.layers.Dense(classes, activation='softmax')(x)
+    return keras.Model(inputs, [x, exit_probs] if early_exit else x)
+
+def build_conv_student(d_model=32, num_heads=[0, 0], classes=5, input_shape=(137, 15), batch_size=32, serving=False):
+    # attention-free student for distillation: one ConvLayer + FeedForward style block per entry of num_heads
+    inputs = keras.layers.Input(shape=input_shape, batch_size=batch_size)
+    x = keras.layers.Conv1D(filters=d_model, kernel_size=1)(inputs)
+    for _ in num_heads:
+        x = FeedForward(d_model=d_model)(x)
+    x = keras.layers.GlobalAveragePooling1D(data_format="channels_first")(x)
+    x = keras.layers.Dense(classes, activation='softmax')(x)
+    return keras.Model(inputs, x)
+
+loss_fn = keras.losses.SparseCategoricalCrossentropy(from_logits=False)
+lds = lambda x, y: tf.math.reduce_sum(keras.losses.kl_divergence(x, y))
+acc_metric = keras.metrics.SparseCategoricalAccuracy()
+
+class CustomSchedule(tf.keras.optimizers.schedules.LearningRateSchedule):
+    def __init__(self, lr, warmup_steps=2000):
+        super().__init__()
+        self.lr = lr
+        self.warmup_steps = warmup_steps
+
+    def __call__(self, step):
+        step = tf.cast(step, dtype=tf.float32)
+        arg1 = tf.math.rsqrt(step)
+        arg2 = step * (self.warmup_steps ** -1.5)
+        return self.lr * tf.math.minimum(arg1, arg2)
+
+def build_optimizer(lr, warmup_steps):
+    learning_rate = CustomSchedule(lr, warmup_steps)
+    optimizer = keras.optimizers.Adam(learning_rate=learning_rate, beta_1=0.9, beta_2=0.98,
+                                     epsilon=1e-9)
+    return optimizer
+
+class TrainingEngine:
+    # One model, optimizer and pair of traced step functions per architecture. lr, warmup_steps, eps and
+    # alpha live in variables and the weights / optimizer slots are re-initialised per trial, so folds
+    # and BO trials after the first reuse the traced graphs instead of tracing them again.
+    # build_fn: build_model or another builder with the same arguments (build_conv_student)
+    def __init__(self, d_model=64, num_heads=[64, 32], classes=5, input_shape=(137, 15), batch_size=32,
+                 build_fn=build_model):
+        self.architecture = (d_model, list(num_heads), classes, tuple(input_shape), batch_size)
+        self.batch_size = batch_size
+        self.build_fn = build_fn
+        self.model = build_fn(d_model=d_model, num_heads=num_heads, classes=classes, input_shape=input_shape,
+                              batch_size=batch_size)
+        self.lr = tf.Variable(1e-3, dtype=tf.float32, trainable=False)
+        self.warmup_steps = tf.Variable(2000., dtype=tf.float32, trainable=False)
+        self.eps = tf.Variable(1., dtype=tf.float32, trainable=False)
+        self.alpha = tf.Variable(1., dtype=tf.float32, trainable=False)
+        self.optimizer = build_optimizer(lr=self.lr, warmup_steps=self.warmup_steps)
+        self.optimizer.build(self.model.trainable_variables)
+        self.acc_metric = keras.metrics.SparseCategoricalAccuracy()
+        self.trials = 0
+        self.trace_time = None   # tracing cost of the step functions, measured on the first trial
+
+        model, optimizer, acc_metric = self.model, self.optimizer, self.acc_metric
+        x_rank = len(input_shape) + 1
+        x_norm_resize_shape = [batch_size] + [1] * len(input_shape)
+
+        @tf.function
+        def pre_train(x, y):
+            with tf.GradientTape() as model_tape:
+                logits = model(x, training=True)
+                loss = self.loss(x, y, logits)
+            grads = model_tape.gradient(loss, model.trainable_weights)
+            optimizer.apply_gradients(zip(grads, model.trainable_weights))
+            acc_metric.update_state(y, self.prediction(logits))
+            acc = acc_metric.result()
+            acc_metric.reset_states()
+
+            return loss, 0., acc
+
+        zeta = 1e-6
+        @tf.function
+        def training_step(x, y):
+            x_p = tf.random.normal(x.shape)
+            x_norm = x_p
+            for i in range(x_rank-1, 0, -1):
+                x_norm = tf.norm(x_norm, ord=2, axis=int(i))
+            x_p /= tf.reshape(x_norm, x_norm_resize_shape)
+            x_p *= zeta
+
+            with tf.GradientTape() as adversarial_tape:
+                adversarial_tape.watch(x_p)
+                y_p = model(x + x_p, training=True)
+                logits = model(x, training=True)
+                l = lds(self.prediction(logits), self.prediction(y_p))
+            g = adversarial_tape.gradient(l, x_p)
+
+            g_norm = g
+            for i in range(x_rank-1, 0, -1):
+                g_norm = tf.norm(g_norm, ord=2, axis=int(i))
+
+            x_p = self.eps * g / (tf.reshape(g_norm, x_norm_resize_shape)+1e-8)
+
+            with tf.GradientTape() as model_tape:
+                y_p = model(x + x_p, training=True)
+                logits = model(x, training=True)
+                l = lds(self.prediction(logits), self.prediction(y_p))    # Recalculate regularization
+                loss = self.loss(x, y, logits) + self.alpha * l / batch_size
+            grads = model_tape.gradient(loss, model.trainable_weights)
+            optimizer.apply_gradients(zip(grads, model.trainable_weights))
+            acc_metric.update_state(y, self.prediction(logits))
+            acc = acc_metric.result()
+            acc_metric.reset_states()
+
+            return loss, l, acc
+
+        self.pre_train = pre_train
+        self.training_step = training_step
+
+    def reset(self, lr, warmup_steps, eps, alpha):
+        # fresh initial weights from an untraced copy of the architecture, zeroed optimizer slots and step
+        d_model, num_heads, classes, input_shape, batch_size = self.architecture
+        self.model.set_weights(self.build_fn(d_model=d_model, num_heads=num_heads, classes=classes,
+                                             input_shape=input_shape, batch_size=batch_size).get_weights())
+        for v in optimizer_variables(self.optimizer):
+            v.assign(tf.zeros_like(v))
+        self.lr.assign(lr)
+        self.warmup_steps.assign(float(warmup_steps))
+        self.eps.assign(eps)
+        self.alpha.assign(alpha)
+        self.acc_metric.reset_states()
+
+    def loss(self, x, y, logits):
+        # supervised part of the training loss, traced into both step functions
+        return loss_fn(y, logits)
+
+    def prediction(self, logits):
+        # the output that VAT, accuracy and validation use, for models with more than one (early_exit)
+        return logits
+
+    def _tracings(self):
+        return self.pre_train.experimental_get_tracing_count() + self.training_step.experimental_get_tracing_count()
+
+    def evaluate(self, X_train, Y_train, X_test, Y_test, epochs, lr, warmup_steps, pretrain_steps, eps, alpha,
+                 save_logs=False, augment=None, vat=True, report=None, run=None, pretrain_cache=None,
+                 init_weights=None):
+        # init_weights: start from these weights instead of a fresh initialisation (fine-tuning)
+        d_model, num_heads, classes, input_shape, batch_size = self.architecture
+        model, optimizer, acc_metric = self.model, self.optimizer, self.acc_metric
+        self.reset(lr, warmup_steps, eps, alpha)
+        if init_weights is not None:
+            model.set_weights(init_weights)
+        tracings = self._tracings()
+        step_times = {}   # step function -> [first call, later calls], for the tracing cost
+
+        def timed(fn, x, y):
+            start = time.perf_counter()
+            out = fn(x, y)
+            if self.trace_time is None:
+                step_times.setdefault(fn, []).append(time.perf_counter() - start)
+            return out
+
+        n_val = len(X_test) // 2
+        x_train, y_train = X_train, Y_train
+        x_val, y_val = X_test[0:n_val], Y_test[0:n_val]
+        x_test, y_test = X_test[n_val:], Y_test[n_val:]
+
+        train_dataset = tf.data.Dataset.from_tensor_slices((x_train, y_train))
+        train_dataset = train_dataset.shuffle(buffer_size=800, reshuffle_each_iteration=True).batch(batch_size, drop_remainder=True)
+        if augment is not None:
+            train_dataset = augment_dataset(train_dataset, augment)
+
+        pre_train, training_step = self.pre_train, self.training_step
+        step_fn = training_step if vat else pre_train
+
+        # start training
+        state, cache_key = None, None
+        if pretrain_cache is not None and pretrain_steps > 0 and init_weights is None:
+            cache_key = pretrain_cache.key((d_model, num_heads, classes, input_shape, batch_size, lr, warmup_steps,
+                                            pretrain_steps, augment is not None and vars(augment)), x_train, y_train)
+            state = pretrain_cache.load(cache_key)
+        if state is not None:
+            set_state(model, state, optimizer)
+        else:
+            for i in range(pretrain_steps):
+                for step, (x, y) in enumerate(train_dataset):
+                    timed(pre_train, x, y)
+            if cache_key is not None:
+                pretrain_cache.store(cache_key, get_state(model, optimizer))
+
+        log = {"training_loss":[], "training_1":[], "training_acc":[],
+               "val_loss":[], "val_acc":[], "test_acc":[], "epoch_time":[]}
+        log_path = "log" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".npy"
+        for epoch in tqdm(range(epochs)):
+            start = time.perf_counter()
+            epoch_loss = 0
+            epoch_l = 0
+            epoch_acc = 0
+            for step, (x, y) in enumerate(train_dataset):
+                batch_loss, batch_l, batch_acc = timed(step_fn, x, y)
+                epoch_loss += float(batch_loss)
+                epoch_l += float(batch_l)
+                epoch_acc += float(batch_acc)
+            epoch_loss /= step+1
+            epoch_l /= step+1
+            epoch_acc /= step+1
+            epoch_time = time.perf_counter() - start
+
+            val_logits = self.prediction(model(x_val, training=False))
+            val_loss = loss_fn(y_val, val_logits)
+            acc_metric.update_state(y_val, val_logits)
+            val_acc = acc_metric.result().numpy()
+            acc_metric.reset_states()
+
+            test_logits = self.prediction(model(x_test, training=False))
+            acc_metric.update_state(y_test, test_logits)
+            test_acc = acc_metric.result().numpy()
+            acc_metric.reset_states()
+
+            log["training_loss"].append(epoch_loss)
+            log["training_1"].append(epoch_l)
+            log["training_acc"].append(epoch_acc)
+            log["val_loss"].append(val_loss)
+            log["val_acc"].append(val_acc)
+            log["test_acc"].append(test_acc)
+            log["epoch_time"].append(epoch_time)   # for time-to-accuracy comparisons
+
+            if save_logs:
+                np.save(log_path, [log])
+                if run is not None and epoch == 0:
+                    run.log_artifact("log", log_path)
+            if run is not None:
+                run.log_epoch(epoch, **{k: v[-1] for k, v in log.items()})
+
+            if report is not None and report(epoch, float(val_loss)):
+                break
+
+        if self.trace_time is None:
+            # first call traces, the median of the others is what a call costs once traced
+            self.trace_time = sum(t[0] - np.median(t[1:]) for t in step_times.values() if len(t) > 1)
+        elif self._tracings() == tracings:
+            print(f"engine trial {self.trials}: reused traced steps, ~{self.trace_time:.1f}s of tracing saved")
+        self.trials += 1
+
+        log['test_acc'] = np.array(log['test_acc'])
+        log['val_loss'] = np.array(log['val_loss'])
+        testing_metric = 0
+        if len(log['test_acc'][np.where(log['val_loss']-min(log['val_loss'])<1e-6)]) != 0:
+            testing_metric = log['test_acc'][np.where(log['val_loss']-min(log['val_loss'])<1e-6)][0]
+        print(testing_metric)
+        if run is not None:
+            run.finish(testing_metric)
+        return testing_metric
+
+_engines = {}
+
+def get_engine(d_model, num_heads, classes, input_shape, batch_size):
+    key = (d_model, tuple(num_heads), classes, tuple(input_shape), batch_size)
+    if key not in _engines:
+        _engines[key] = TrainingEngine(d_model, num_heads, classes, input_shape, batch_size)
+    return _engines[key]
+
+def evaluate(X_train, Y_train, X_test, Y_test, hyperparameters, save_logs=False, augment=None, vat=True, report=None,
+             run=None, pretrain_cache=None, reuse=True):
+    # augment: an augment.AugmentConfig applied on the input pipeline; vat=False trains without VAT
+    # report: called as report(epoch, val_loss) after every epoch, training stops when it returns True
+    # run: a registry.Run that receives the per-epoch metrics, the log file and the final accuracy
+    # pretrain_cache: a pretrain_cache.PretrainCache, trials sharing the pretraining setup and fold reuse it
+    # reuse: train on the process-wide TrainingEngine of this architecture instead of a new one
+    d_model, num_heads, classes, input_shape, batch_size, epochs, lr, warmup_steps, pretrain_steps, eps, alpha = hyperparameters
+    if input_shape is None:
+        input_shape = tuple(X_train.shape[1:])  # any frontend from features.py
+    if reuse:
+        engine = get_engine(d_model, num_heads, classes, input_shape, batch_size)
+    else:
+        engine = TrainingEngine(d_model, num_heads, classes, input_shape, batch_size)
+    return engine.evaluate(X_train, Y_train, X_test, Y_test, epochs, lr, warmup_steps, pretrain_steps, eps, alpha,
+                           save_logs=save_logs, augment=augment, vat=vat, report=report, run=run,
+                           pretrain_cache=pretrain_cache)
+
+def k_fold_cross_validation(data, hyperparameters, k, **kwargs):
+    X, Y = data
+    dataset = make_dataset(X, Y, k)
+    results = []
+    for X_train, Y_train, X_test, Y_test in dataset:
+        results.append(evaluate(X_train, Y_train, X_test, Y_test, hyperparameters, **kwargs))
+    return(results)